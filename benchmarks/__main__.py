@@ -0,0 +1,54 @@
+import os
+import json
+
+import click
+
+from benchmarks.generator import generate_csv
+from benchmarks.run import compare_results, load_results, run_benchmarks
+
+@click.group()
+def cli():
+    """Benchmarks of the import and the API on synthetic data."""
+
+@cli.command("generate")
+@click.argument("path", default="realtor-data.csv")
+@click.option("--rows", default=10000, help="listings written")
+@click.option("--seed", default=0, help="the same seed writes the same file")
+def command_generate(path, rows, seed):
+    """Write a synthetic realtor-data.csv."""
+    generate_csv(path, rows, seed)
+    print(f"{rows} rows written to {path}")
+
+@cli.command("run")
+@click.option("--rows", default=10000, help="listings imported")
+@click.option("--seed", default=0)
+@click.option("--repeat", default=20, help="requests measured per benchmark")
+@click.option("--workers", default=os.cpu_count(), help="processes of import-csv")
+@click.option("--workdir", default="benchmark-data", help="directory of the csv and the database")
+@click.option("--output", default="benchmark-results.json")
+def command_run(rows, seed, repeat, workers, workdir, output):
+    """Import a synthetic csv and measure the import and the API."""
+    output = os.path.abspath(output)
+    results = run_benchmarks(workdir, rows, seed, repeat, workers)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    for name, metric in sorted(results["metrics"].items()):
+        print(f"{name:60} {metric['value']:12.2f} {metric['unit']}")
+    print(f"Results written to {output}")
+
+@cli.command("compare")
+@click.argument("base")
+@click.argument("new")
+@click.option("--threshold", default=0.1, help="share a metric may get worse")
+def command_compare(base, new, threshold):
+    """Fail when a metric of NEW is worse than in BASE past the threshold."""
+    base, new = load_results(base), load_results(new)
+    regressions = compare_results(base, new, threshold)
+    for name, base_value, new_value, change in regressions:
+        print(f"{name:60} {base_value:12.2f} -> {new_value:12.2f} ({change:+.1%})")
+    if regressions:
+        raise click.ClickException(f"{len(regressions)} metrics regressed more than {threshold:.0%}")
+    print("No regressions")
+
+if __name__ == "__main__":
+    cli()
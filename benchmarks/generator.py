@@ -0,0 +1,112 @@
+import csv
+import math
+import random
+
+columns = [
+    "brokered_by", "status", "price", "bed", "bath", "acre_lot", "street",
+    "city", "state", "zip_code", "house_size", "prev_sold_date",
+]
+
+# population in millions, listings follow it, the last two are
+# in the real dataset but not in state_map
+state_weights = {
+    "Alabama": 5.1, "Alaska": 0.7, "Arizona": 7.4, "Arkansas": 3.0,
+    "California": 39.0, "Colorado": 5.9, "Connecticut": 3.6, "Delaware": 1.0,
+    "Florida": 22.6, "Georgia": 11.0, "Hawaii": 1.4, "Idaho": 2.0,
+    "Illinois": 12.5, "Indiana": 6.9, "Iowa": 3.2, "Kansas": 2.9,
+    "Kentucky": 4.5, "Louisiana": 4.6, "Maine": 1.4, "Maryland": 6.2,
+    "Massachusetts": 7.0, "Michigan": 10.0, "Minnesota": 5.7, "Mississippi": 2.9,
+    "Missouri": 6.2, "Montana": 1.1, "Nebraska": 2.0, "Nevada": 3.2,
+    "New Hampshire": 1.4, "New Jersey": 9.3, "New Mexico": 2.1, "New York": 19.6,
+    "North Carolina": 10.8, "North Dakota": 0.8, "Ohio": 11.8, "Oklahoma": 4.0,
+    "Oregon": 4.2, "Pennsylvania": 13.0, "Rhode Island": 1.1, "South Carolina": 5.4,
+    "South Dakota": 0.9, "Tennessee": 7.1, "Texas": 30.5, "Utah": 3.4,
+    "Vermont": 0.6, "Virginia": 8.7, "Washington": 7.8, "West Virginia": 1.8,
+    "Wisconsin": 5.9, "Wyoming": 0.6, "Puerto Rico": 3.2, "Virgin Islands": 0.1,
+}
+
+statuses = ["for_sale", "sold", "ready_to_build"]
+status_weights = [0.6, 0.39, 0.01]
+
+syllables = ["ash", "bel", "brook", "car", "dale", "el", "field", "glen", "ham", "lake",
+             "land", "mont", "new", "ock", "port", "ridge", "ton", "val", "ville", "wood"]
+
+def city_name(rng):
+    return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).title()
+
+def build_places(rng):
+    """
+    cities with their zip codes for each state, a few cities hold
+    most listings, and a price factor since some states cost more
+    """
+    places = {}
+    for number, (state, weight) in enumerate(state_weights.items()):
+        cities = []
+        city_cumulative = []
+        total = 0
+        zip_code = 1000 + number * 1900
+        for rank in range(1, max(int(weight * 15), 5) + 1):
+            zip_count = max(1, int(12 / rank)) + rng.randint(0, 2)
+            cities.append((city_name(rng), [f"{zip_code + i}.0" for i in range(zip_count)]))
+            zip_code += zip_count
+            total += 1 / rank
+            city_cumulative.append(total)
+        places[state] = (cities, city_cumulative, rng.uniform(0.7, 1.3))
+    return places
+
+def float_text(value, digits=0):
+    # the real file writes every number as a float, 3 is 3.0
+    return str(float(round(value, digits)))
+
+def maybe(rng, share, value):
+    """value, or an empty cell share of the time"""
+    return "" if rng.random() < share else value
+
+def generate_row(rng, places, states, state_cumulative):
+    state = rng.choices(states, cum_weights=state_cumulative)[0]
+    cities, city_cumulative, state_factor = places[state]
+    city, zip_codes = rng.choices(cities, cum_weights=city_cumulative)[0]
+    bed = min(max(int(rng.gauss(3, 1.1)), 1), 9)
+    bath = min(max(bed - rng.randint(0, 2), 1), 7)
+    house_size = (500 + 450 * bed) * rng.lognormvariate(0, 0.3)
+    price = 350000 * state_factor * rng.lognormvariate(0, 0.8) * (0.6 + bed / 7.5)
+    return [
+        maybe(rng, 0.05, float_text(rng.randint(1, 110000))),
+        rng.choices(statuses, weights=status_weights)[0],
+        maybe(rng, 0.001, float_text(price, -3 if price > 10000 else 0)),
+        maybe(rng, 0.1, float_text(bed)),
+        maybe(rng, 0.12, float_text(bath)),
+        maybe(rng, 0.15, float_text(rng.lognormvariate(math.log(0.2), 1.2), 2)),
+        maybe(rng, 0.01, float_text(rng.randint(1, 2000000))),
+        city,
+        state,
+        maybe(rng, 0.001, rng.choice(zip_codes)),
+        maybe(rng, 0.25, float_text(house_size)),
+        maybe(rng, 0.5, f"{rng.randint(1990, 2022)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}"),
+    ]
+
+def generate_csv(path, rows, seed=0, duplicates=0.002):
+    """
+    writes rows listings in the layout of realtor-data.csv, the same
+    seed writes the same file, duplicates is the share of repeated lines
+    """
+    rng = random.Random(seed)
+    places = build_places(rng)
+    states = list(state_weights)
+    state_cumulative = []
+    total = 0
+    for state in states:
+        total += state_weights[state]
+        state_cumulative.append(total)
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(columns)
+        previous = None
+        for _ in range(rows):
+            if previous is not None and rng.random() < duplicates:
+                row = previous
+            else:
+                row = generate_row(rng, places, states, state_cumulative)
+            writer.writerow(row)
+            previous = row
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import platform
+import subprocess
+from unittest import mock
+
+from benchmarks.generator import generate_csv
+
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+def latency_metrics(name, samples):
+    """p50 and p95 of samples in seconds, as milliseconds"""
+    return {
+        f"{name}.p50": metric(1000 * percentile(samples, 0.5), "ms", "lower"),
+        f"{name}.p95": metric(1000 * percentile(samples, 0.95), "ms", "lower"),
+    }
+
+def measure(call, repeat, warmup=1):
+    for i in range(warmup):
+        call(-1 - i)
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def flask(workdir, *args):
+    """runs a flask command of the app with workdir as basedir"""
+    env = dict(os.environ, PYTHONPATH=repo_path, FLASK_APP="src.app", SQLITE_PROFILE="default")
+    subprocess.run([sys.executable, "-m", "flask", *args], cwd=workdir, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+def benchmark_import(workdir, rows, workers):
+    for name in os.listdir(workdir):
+        if name.startswith("database"):
+            os.remove(os.path.join(workdir, name))
+    flask(workdir, "init-db")
+    start = time.perf_counter()
+    flask(workdir, "import-csv", "--workers", str(workers), "--full")
+    seconds = time.perf_counter() - start
+    return {
+        "import.seconds": metric(seconds, "s", "lower"),
+        "import.rows_per_second": metric(rows / seconds, "rows/s", "higher"),
+    }
+
+# the zipwho.com pages returned instead of opening the browser
+details_table = "<table>%s</table>" % "".join(
+    f"<tr><td>label</td><td>{value}</td><td>rank</td></tr>" for value in range(17)
+)
+
+def search_table(zip_codes):
+    return "<table>%s</table>" % "".join(
+        f"<tr><td>n</td><td><a>{zip_code}<br>state</a></td><td>value</td></tr>"
+        for zip_code in zip_codes
+    )
+
+def fill_demographics(db_path, skip_state_code, seed):
+    """
+    a demographic row for the zip codes of every state but
+    skip_state_code, it returns the zip codes
+    """
+    from src.zipwho import table_attributes
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    zip_codes = [row[0] for row in conn.execute(
+        "SELECT DISTINCT zip_code FROM house WHERE state_code != ? AND zip_code != ''",
+        (skip_state_code,),
+    )]
+    conn.executemany(
+        f"INSERT OR REPLACE INTO demographic (zip_code, {', '.join(table_attributes)}) "
+        f"VALUES (?, {', '.join('?' for _ in table_attributes)})",
+        [[zip_code] + [rng.uniform(0, 100000) for _ in table_attributes] for zip_code in zip_codes],
+    )
+    conn.commit()
+    conn.close()
+    return zip_codes
+
+def property_cases(conn):
+    """the main filter combinations with values taken from the data"""
+    state_code, = conn.execute(
+        "SELECT state_code FROM house WHERE state_code != '' "
+        "GROUP BY state_code ORDER BY count(*) DESC LIMIT 1"
+    ).fetchone()
+    city, = conn.execute(
+        "SELECT city FROM house WHERE state_code = ? GROUP BY city ORDER BY count(*) DESC LIMIT 1",
+        (state_code,),
+    ).fetchone()
+    zip_code, = conn.execute(
+        "SELECT zip_code FROM house WHERE state_code = ? GROUP BY zip_code ORDER BY count(*) DESC LIMIT 1",
+        (state_code,),
+    ).fetchone()
+    return {
+        "status": {"status": "for_sale"},
+        "state": {"status": "for_sale", "state_code": state_code},
+        "state_price": {"status": "for_sale", "state_code": state_code,
+                        "min_price": 200000, "max_price": 500000},
+        "state_beds": {"status": "for_sale", "state_code": state_code, "min_bed": 3, "min_bath": 2},
+        "price_per_sqft": {"status": "sold", "min_price_per_sqft": 100, "max_price_per_sqft": 200},
+        "city": {"status": "for_sale", "city": city},
+        "zip_code": {"status": "for_sale", "zip_code": zip_code},
+    }
+
+def get_ok(client, path, query_string):
+    """the response of a request that has to succeed, so errors are never timed"""
+    response = client.get(path, query_string=query_string)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} {query_string} returned {response.status_code}")
+    return response
+
+def benchmark_properties(client, cases, repeat):
+    metrics = {}
+    for name, args in cases.items():
+        # the pages depend on the rows generated and the filters
+        pages = max(get_ok(client, "/properties", args).json["pages"], 1)
+        for label, page in (("first", 1), ("middle", (pages + 1) // 2), ("last", pages)):
+            query_string = {**args, "page": page}
+            get_ok(client, "/properties", query_string)
+            samples = measure(
+                lambda i: client.get("/properties", query_string=query_string),
+                repeat,
+            )
+            metrics.update(latency_metrics(f"properties.{name}.page_{label}", samples))
+
+        # walking 10 pages with the cursor, each request from the previous one
+        def walk(i):
+            cursor = ""
+            for _ in range(10):
+                query_string = {**args, "total": "none", "cursor": cursor}
+                cursor = client.get("/properties", query_string=query_string).json["next_cursor"]
+                if cursor is None:
+                    break
+        metrics.update(latency_metrics(f"properties.{name}.cursor_10_pages", measure(walk, repeat)))
+    return metrics
+
+def benchmark_demographics(app, client, zip_code, covered_state_code, scraped_state_code, repeat):
+    from src.demographic import get_demographic
+    from src.http_cache import response_cache
+
+    def goto_and_select(full_url, selector, page=None):
+        if "mode=zip" in full_url:
+            return details_table
+        return search_table(["1001.0", "1002.0"])
+
+    metrics = {}
+    with mock.patch("src.zipwho.goto_and_select", goto_and_select), app.app_context():
+        metrics.update(latency_metrics(
+            "get_demographic.stored",
+            measure(lambda i: get_demographic(zip_code), repeat),
+        ))
+        metrics.update(latency_metrics(
+            "get_demographic.scraped",
+            measure(lambda i: get_demographic(f"bench{i}"), repeat),
+        ))
+
+    def zips(state_code, min_income):
+        # the responses of the memory cache are not measured
+        response_cache.clear()
+        client.get("/zips_by_demographics", query_string={
+            "state_code": state_code, "min_median_income": min_income, "max_median_income": 80000,
+        })
+
+    with mock.patch("src.zipwho.goto_and_select", goto_and_select):
+        metrics.update(latency_metrics(
+            "zips_by_demographics.engine",
+            measure(lambda i: zips(covered_state_code, 20000 + i), repeat),
+        ))
+        metrics.update(latency_metrics(
+            "zips_by_demographics.scraped",
+            measure(lambda i: zips(scraped_state_code, 20000 + i), repeat),
+        ))
+        metrics.update(latency_metrics(
+            "zips_by_demographics.search_cache",
+            measure(lambda i: zips(scraped_state_code, 20000), repeat),
+        ))
+    return metrics
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo_path, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+def run_benchmarks(workdir, rows, seed=0, repeat=20, workers=os.cpu_count()):
+    """
+    generates a csv of rows listings in workdir, imports it and
+    measures the API against it, it returns the results document
+    """
+    os.makedirs(workdir, exist_ok=True)
+    workdir = os.path.abspath(workdir)
+    generate_csv(os.path.join(workdir, "realtor-data.csv"), rows, seed)
+
+    metrics = benchmark_import(workdir, rows, workers)
+
+    # src reads basedir from the working directory when it's imported
+    os.chdir(workdir)
+    os.environ["SQLITE_PROFILE"] = "default"
+    from src.app import app
+    from src.conf import db_path
+
+    conn = sqlite3.connect(db_path)
+    states = [row[0] for row in conn.execute(
+        "SELECT state_code FROM house WHERE state_code != '' "
+        "GROUP BY state_code ORDER BY count(*) DESC"
+    )]
+    cases = property_cases(conn)
+    conn.close()
+    # the largest state has demographics so /properties uses the
+    # local engine, the second one is answered by zipwho.com
+    zip_codes = fill_demographics(db_path, states[1], seed)
+
+    client = app.test_client()
+    metrics.update(benchmark_properties(client, cases, repeat))
+    metrics.update(benchmark_demographics(app, client, zip_codes[0], states[0], states[1], repeat))
+
+    return {
+        "meta": {
+            "rows": rows,
+            "seed": seed,
+            "repeat": repeat,
+            "workers": workers,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": metrics,
+    }
+
+def compare_results(base, new, threshold):
+    """
+    the metrics of new that are worse than in base by more than
+    threshold, a share of the base value, as (name, base, new, change)
+    """
+    regressions = []
+    for name, base_metric in base["metrics"].items():
+        new_metric = new["metrics"].get(name)
+        if new_metric is None or not base_metric["value"]:
+            continue
+        change = (new_metric["value"] - base_metric["value"]) / base_metric["value"]
+        worse = change if base_metric["better"] == "lower" else -change
+        if worse > threshold:
+            regressions.append((name, base_metric["value"], new_metric["value"], change))
+    return regressions
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
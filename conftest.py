@@ -1,22 +1,29 @@
+import os
 import pytest
+from sqlalchemy import create_engine
+
 from src import flask_config
 flask_config.config["TESTING"] = True
 flask_config.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
 
+from src import conf
+from src import app as app_module
 from src.app import app as flask_app
 from src.app import db
 from src.house import House
 from src.demographic import Demographic
+from src.http_cache import response_cache
 
 @pytest.fixture
 def app():
 
     with flask_app.app_context():
         db.create_all()
+        response_cache.clear()
 
-        h1 = House(id="hash1", status="for_sale", price=100000.0, bed=1, zip_code=111)
-        h2 = House(id="hash2", status="for_sale", price=200000.0, bed=2, zip_code=222)
-        h3 = House(id="hash3", status="for_sale", price=300000.0, bed=3, zip_code=333)
+        h1 = House(id="1" * 64, status="for_sale", price=100000.0, bed=1, zip_code=111)
+        h2 = House(id="2" * 64, status="for_sale", price=200000.0, bed=2, zip_code=222)
+        h3 = House(id="3" * 64, status="for_sale", price=300000.0, bed=3, zip_code=333)
         d1 = Demographic(zip_code=111, median_income=111)
         d2 = Demographic(zip_code=222, median_income=222)
         # zip_code 333 does not exists in demographics
@@ -31,4 +38,29 @@ def app():
 
 @pytest.fixture
 def client(app):
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    """
+    the app on an empty database.db in tmp_path, for the commands
+    that open the database file with sqlite3
+    """
+    path = str(tmp_path / "database.db")
+    monkeypatch.setattr(conf, "db_path", path)
+    monkeypatch.setattr(app_module, "db_path", path)
+    monkeypatch.setattr(app_module, "basedir", str(tmp_path))
+
+    with flask_app.app_context():
+        engines = db.engines
+        memory_engine = engines[None]
+        engines[None] = create_engine("sqlite:///" + path)
+        monkeypatch.setattr(conf, "database_realpath", os.path.realpath(path))
+        db.create_all()
+        response_cache.clear()
+
+        yield flask_app
+
+        db.session.remove()
+        engines[None].dispose()
+        engines[None] = memory_engine
@@ -1,123 +1,374 @@
 import os
-import csv
-import hashlib
+import time
+import asyncio
 import sqlite3
-import requests
-from flask import jsonify, request
-from sqlalchemy import select, distinct
-
-from src.conf import app, basedir, db_path, db, state_map, to_float
-from src.house import House, get_house_by_property, house_to_dict
-from src.demographic import get_demographic
-from src.zipwho import get_zips_by_demographics
-from src.browser import sync_playwright
-
-def db_optimization(cursor):
-    # Disables rollback log
-    cursor.execute("PRAGMA journal_mode = OFF;")
-    # Doesn't wait for disk write confirmation
-    cursor.execute("PRAGMA synchronous = OFF;")
-    # Uses 1GB of RAM for cache
-    cursor.execute("PRAGMA cache_size = -1000000;")
-    # Prevents other apps from touching DB
-    cursor.execute("PRAGMA locking_mode = EXCLUSIVE;")
-
-def insert_house(cursor, buffer):
-    cursor.executemany(
-        "INSERT OR IGNORE INTO house (brokered_by, status, price, bed, bath, acre_lot, street, city, state, zip_code, house_size, prev_sold_date, state_code, price_per_acre, price_per_sq_ft, id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-        buffer
-    )
+import click
+from urllib.parse import parse_qsl
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import create_engine, text
+from werkzeug.datastructures import ImmutableMultiDict
+
+from src.conf import app, basedir, create_tables, db_path, db, follow_database_swap, writer_engine
+from src.house import (
+    House,
+    create_house_indexes,
+    drop_house_indexes,
+    export_houses,
+    filter_house_query,
+    get_houses,
+    get_house_by_property,
+    house_lookup_latency,
+    house_table_sql,
+    house_to_dict,
+    is_house_id,
+    is_house_migrated,
+    migrate_house_ids,
+    order_by_sort,
+    parse_sort,
+    CursorPage,
+    count_cache,
+)
+from src.demographic import get_demographic, get_demographics
+from src.demographic_engine import get_zips_by_demographics
+from src.browser import HttpPool, PagePool, page_pool_stats
+from src.http_cache import bump_generation, bump_generation_sql, cached_response
+from src.zip_search_cache import get_zip_search_cache_stats
+from src.house_engine import build_house_columns
+from src.importer import (
+    chunk_size,
+    copy_tables,
+    db_optimization,
+    existing_house_ids,
+    header_end,
+    import_csv,
+    import_stream,
+    is_stream,
+    open_stream,
+    read_manifest,
+    remove_database,
+    resume_offset,
+    shadow_db_path,
+    swap_database,
+    write_manifest,
+)
+from src.stats import (
+    build_market_stats,
+    get_market_stats,
+    market_stats_to_dict,
+    stats_levels,
+    update_market_stats,
+)
+from src.facets import build_house_facets, get_facets, update_house_facets
+from src.autocomplete import (
+    build_house_names,
+    is_house_names_built,
+    name_fields,
+    search_names,
+    update_house_names,
+)
+from src.scraper import (
+    Checkpoint,
+    pending_zip_codes,
+    refresh_demographics,
+    scrape_zip_codes,
+    stale_zip_codes,
+)
+from src.downloader import Download, DownloadError, max_line_size
+from src.metrics import finish_request, listen_sql_events, render_metrics, start_request, timed
+
+realtor_data_url = "https://getgloby-realtor-challenge.s3.us-east-1.amazonaws.com/realtor-data.csv"
+
+export_mimetypes = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
 
 @app.cli.command("init-db")
 def command_init_db():
     """Clear existing data and create new tables."""
-    db.create_all()
+    # the house indexes are declared in the model so create_all builds them
+    create_tables()
     print("Database initialized!")
 
-@app.cli.command("import-csv")
-def command_import_csv():
+@app.cli.command("enable-wal")
+def command_enable_wal():
+    """Switch the database to WAL so the API reads while imports write."""
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    db_optimization(cursor)
+    journal_mode, = conn.execute("PRAGMA journal_mode = WAL;").fetchone()
+    conn.close()
+    print(f"Journal mode: {journal_mode}")
 
-    csv_file_path = os.path.join(basedir, 'realtor-data.csv')
+@app.cli.command("import-csv")
+@click.argument("path", required=False)
+@click.option("--workers", default=os.cpu_count(), help="processes parsing the csv")
+@click.option("--full", is_flag=True, help="import the whole file even if it only grew")
+@click.option("--shadow", is_flag=True, help="build a new database and swap it in when ready")
+def command_import_csv(path, workers, full, shadow):
+    """Import realtor-data.csv, another csv, a compressed one or - for stdin."""
+    csv_file_path = path or os.path.join(basedir, 'realtor-data.csv')
 
-    if not os.path.exists(csv_file_path):
+    if csv_file_path != "-" and not os.path.exists(csv_file_path):
         print(f"Error: {csv_file_path} not found.")
         return
 
-    with open(csv_file_path, mode='r') as file:
-        # skip header
-        file.readline()
-
-        count_added = 0
-        in_batch = 0
-        batch_size = 100000
-        buffer = []
-
-        for raw_line in file:
-            raw_line = raw_line.strip()
-            if not raw_line:
-                continue
-
-            row_hash = hashlib.sha256(raw_line.encode('utf-8')).hexdigest()
-
-            columns = next(csv.reader([raw_line]))
-
-            state = columns[8]
-            state_code = state_map.get(state, "")
-            columns.append(state_code)
-            
-            price = to_float(columns[2])
-            if price is None or price <= 0:
-                continue
-            columns[2] = price
-
-            acre_lot = to_float(columns[5]) or 0
-            columns[5] = acre_lot
-            price_per_acre = 0 if acre_lot == 0 else price / acre_lot
-            columns.append(price_per_acre)
-
-            house_size = to_float(columns[10]) or 0
-            columns[10] = house_size
-            price_per_sq_ft = 0 if house_size == 0 else price / house_size
-            columns.append(price_per_sq_ft)
-
-            columns.append(row_hash)
-            buffer.append(columns)
-
-            count_added += 1
-            in_batch += 1
-            if in_batch == batch_size:
-                insert_house(cursor, buffer)
-                conn.commit()
-                print("completed %.2f %%" % (100 * count_added / 2300000))
-                in_batch = 0
-                buffer = []
-
-        if buffer:
-            insert_house(cursor, buffer)
-            conn.commit()
-            print("completed %.2f %%" % (100 * count_added / 2300000))
-            in_batch = 0
-            buffer = []
-
-        print(f"Import finished: {count_added} added")
+    if not is_stream(csv_file_path):
+        run_import(csv_file_path, workers, full, shadow)
+        return
+
+    try:
+        stream = open_stream(csv_file_path)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    with stream:
+        run_import(csv_file_path, workers, full, shadow, stream=stream)
+
+def run_import(csv_file_path, workers, full, shadow, download=None, stream=None):
+    """
+    imports csv_file_path, with download the file it's downloading
+    to csv_file_path while its blocks arrive and with stream the
+    decompressed file or the standard input read from stream
+    """
+    if shadow:
+        # the API keeps reading the live database until the swap
+        target_path = shadow_db_path(db_path)
+        print(f"building {target_path}")
+        engine = create_engine("sqlite:///" + target_path)
+        db.metadata.create_all(engine)
+        engine.dispose()
+    else:
+        target_path = db_path
+        # creates the tables and columns added since the database was initialized
+        create_tables()
+
+    conn = sqlite3.connect(target_path)
+    cursor = conn.cursor()
+    db_optimization(cursor)
+
+    # a stream is read once so it has no manifest and no offset
+    manifest = None if stream else read_manifest(cursor, csv_file_path)
+    offset = None if full or download or stream else resume_offset(csv_file_path, manifest)
+
+    if offset is not None:
+        # the file only grew, the new lines are few so the
+        # indexes are kept and updated as rows are inserted
+        print(f"resuming at byte {offset}")
+        # indexes added to house_indexes since the last full import
+        create_house_indexes(cursor)
+        stats_rows = []
+        name_rows = []
+        facet_ids = []
+
+        def on_rows(rows):
+            stats_rows.extend((r[1], r[7], r[9], r[12], r[2], r[14]) for r in rows)
+            name_rows.extend((r[7], r[8], r[6]) for r in rows)
+            facet_ids.extend(r[-1] for r in rows)
+
+        count_added, offset = import_csv(
+            conn, csv_file_path, workers=workers, start=offset, on_rows=on_rows,
+        )
+        print("updating market stats")
+        update_market_stats(conn, stats_rows)
+        print("updating autocomplete names")
+        if is_house_names_built(conn):
+            update_house_names(conn, name_rows)
+        else:
+            # the names were added after the last full import
+            build_house_names(conn)
+        print("updating facet counts")
+        if cursor.execute("SELECT 1 FROM house_facet LIMIT 1").fetchone():
+            update_house_facets(conn, facet_ids)
+        else:
+            build_house_facets(conn)
+    else:
+        existing_ids = None
+        if manifest is not None:
+            # the file changed, only the rows that are not in the table are inserted
+            existing_ids = existing_house_ids(cursor)
+        elif stream and cursor.execute("SELECT 1 FROM house LIMIT 1").fetchone():
+            # the ids are hashes of the decompressed lines so a stream of
+            # a file that was already imported adds nothing
+            existing_ids = existing_house_ids(cursor)
+
+        # maintaining the indexes row by row is much slower than
+        # building them once after the bulk load
+        drop_house_indexes(cursor)
+
+        if stream is not None:
+            count_added = import_stream(conn, stream, workers=workers, existing_ids=existing_ids)
+        elif download is None:
+            count_added, offset = import_csv(
+                conn, csv_file_path, workers=workers, existing_ids=existing_ids
+            )
+        else:
+            try:
+                # the parsers read the part file as the download writes it
+                download.wait_for(max_line_size)
+                start = header_end(download.part_path)
+                # without ranges the size is only known at the end
+                count_added, offset = import_csv(
+                    conn, download.part_path, workers=workers, existing_ids=existing_ids,
+                    start=start, ranges=download.line_ranges(start, chunk_size),
+                    end=download.size if download.ranges else None,
+                )
+                # a wrong checksum stops here, before the manifest and the swap
+                download.finish()
+            except DownloadError:
+                if shadow:
+                    conn.close()
+                    remove_database(target_path)
+                raise
+            print(f"Download complete: {csv_file_path}")
+
+        print("rebuilding indexes")
+        create_house_indexes(cursor)
+        cursor.execute("ANALYZE;")
+
+        print("rebuilding market stats")
+        build_market_stats(conn)
+
+        print("rebuilding autocomplete names")
+        build_house_names(conn)
+
+        print("rebuilding facet counts")
+        build_house_facets(conn)
+
+    if stream is None:
+        write_manifest(cursor, csv_file_path, offset)
+    if shadow:
+        # the exclusive lock of the bulk load would extend to the live database
+        conn.commit()
+        conn.close()
+        conn = sqlite3.connect(target_path)
+        cursor = conn.cursor()
+        if os.path.exists(db_path):
+            print("copying demographics")
+            copy_tables(conn, db_path, ["demographic", "zip_search_cache", "data_generation"])
+            live_conn = sqlite3.connect(db_path)
+            journal_mode, = live_conn.execute("PRAGMA journal_mode;").fetchone()
+            live_conn.close()
+            if journal_mode == "wal":
+                # WAL is a setting of the file, see enable-wal
+                cursor.execute("PRAGMA journal_mode = WAL;")
+    # the cached responses of the API are stale now
+    cursor.execute(bump_generation_sql)
+    conn.commit()
+
+    if shadow:
+        swap_database(db_path, target_path)
+        print(f"swapped {db_path} to {target_path}")
+
+    if app.config["HOUSE_ENGINE"] == "columnar":
+        print("rebuilding house columns")
+        build_house_columns(conn, app.config["HOUSE_COLUMNS_PATH"])
+    # releases the exclusive lock of db_optimization
+    conn.close()
+
+    print(f"Import finished: {count_added} added")
+
+@app.cli.command("build-house-columns")
+def command_build_house_columns():
+    """Write the house columns used by the columnar engine."""
+    conn = sqlite3.connect(db_path)
+    count = build_house_columns(conn, app.config["HOUSE_COLUMNS_PATH"])
+    print(f"House columns built: {count} rows")
+
+@app.cli.command("explain-query")
+@click.argument("query_string")
+def command_explain_query(query_string):
+    """Print the query plan of /properties for a query string.
+
+    for example: flask explain-query "status=for_sale&state_code=CA&min_price=1000"
+    """
+    args = ImmutableMultiDict(parse_qsl(query_string))
+    if not args.get("status"):
+        print("Error: the 'status' argument is required.")
+        return
+    sort = parse_sort(args)
+    if sort is False:
+        print("Error: the 'sort' argument is invalid.")
+        return
+    # the ORDER BY and the LIMIT of the page /properties reads
+    query = filter_house_query(args)
+    if sort is not None:
+        query = order_by_sort(query, sort)
+    per_page = min(max(args.get('per_page', 20, type=int), 1), 500)
+    page = max(args.get('page', 1, type=int), 1)
+    query = query.limit(per_page).offset((page - 1) * per_page)
+    compiled = query.statement.compile(
+        dialect=db.engine.dialect,
+        compile_kwargs={"literal_binds": True},
+    )
+    print(compiled)
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+    for _, _, _, detail in rows:
+        print(detail)
 
 @app.cli.command("download-csv")
-def command_download_s3_csv():
-    url = "https://getgloby-realtor-challenge.s3.us-east-1.amazonaws.com/realtor-data.csv"
+@click.option("--url", default=realtor_data_url, help="where the csv is downloaded from")
+@click.option("--connections", default=8, help="parallel range requests")
+@click.option("--sha256", default=None, help="expected checksum, the S3 ETag md5 is checked otherwise")
+@click.option("--pipe-import", is_flag=True, help="import the rows while the file downloads")
+@click.option("--workers", default=os.cpu_count(), help="processes parsing the csv with --pipe-import")
+@click.option("--shadow", is_flag=True, help="build a new database with --pipe-import and swap it in")
+def command_download_s3_csv(url, connections, sha256, pipe_import, workers, shadow):
+    """Download the csv, resuming a previous interrupted download."""
     dest_path = os.path.join(basedir, "realtor-data.csv")
+    download = Download(url, dest_path, connections=connections, sha256=sha256)
     print(f"Downloading {url}...")
-    # stream=True allows us to download the file in pieces
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(dest_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192): 
-                f.write(chunk)
-    print(f"Download complete: {dest_path}")
+    try:
+        if pipe_import:
+            download.start()
+            run_import(dest_path, workers, True, shadow, download=download)
+        else:
+            download.download()
+            print(f"Download complete: {dest_path}")
+    except DownloadError as error:
+        raise click.ClickException(str(error))
+
+@app.cli.command("migrate-house-ids")
+def command_migrate_house_ids():
+    """Store the house ids as 32 bytes in a WITHOUT ROWID table."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    if house_table_sql(cursor) is None:
+        print("There is no house table, the next import-csv creates it migrated.")
+        return
+    if is_house_migrated(cursor):
+        print("The house table is already migrated.")
+        return
+
+    def report(when):
+        size = os.path.getsize(db_path) / 1024 / 1024
+        latency = house_lookup_latency(cursor) * 1000000
+        print(f"{when}: {size:.1f} MB, {latency:.1f} us per lookup by id")
+
+    report("before")
+    migrate_house_ids(conn)
+    report("after")
+
+with app.app_context():
+    listen_sql_events(db.engine)
+if writer_engine is not None:
+    listen_sql_events(writer_engine)
+
+@app.before_request
+def start_request_metrics():
+    start_request()
+
+@app.after_request
+def finish_request_metrics(response):
+    return finish_request(response)
+
+@app.before_request
+def follow_shadow_import():
+    # a worker moves to the new database on its next request, whose
+    # generation can be one the cached totals were counted with
+    if follow_database_swap():
+        count_cache.clear()
 
 @app.route('/zips_by_demographics', methods=['GET'])
+@cached_response
 def api_get_zips_by_demographics():
     zips = get_zips_by_demographics(request.args)
     if zips:
@@ -125,22 +376,104 @@ def api_get_zips_by_demographics():
     else:
         return jsonify({"error": "no zips found"}), 404
 
+@app.route('/zips_by_demographics/cache', methods=['GET'])
+def api_get_zip_search_cache_stats():
+    return jsonify(get_zip_search_cache_stats())
+
 @app.route('/properties', methods=['GET'])
 def api_get_house_by_property():
     pagination = get_house_by_property(request.args)
+    # the arguments were invalid
+    if isinstance(pagination, tuple):
+        return pagination
+    # the rows are loaded by pagination so this is only the json
+    with timed("serialize"):
+        if isinstance(pagination, CursorPage):
+            return jsonify({
+                "total": pagination.total,
+                "per_page": pagination.per_page,
+                "next_cursor": pagination.next_cursor,
+                "results": [
+                    house_to_dict(h) for h in pagination.items
+                ]
+            })
+        return jsonify({
+            "total": pagination.total,
+            "pages": pagination.pages,
+            "current_page": pagination.page,
+            "per_page": pagination.per_page,
+            "results": [
+                house_to_dict(h) for h in pagination.items
+            ]
+        })
+
+@app.route('/properties/export', methods=['GET'])
+def api_export_house_by_property():
+    if not request.args.get('status'):
+        return jsonify({"error": "The 'status' argument is required."}), 400
+    format = request.args.get('format', 'ndjson')
+    if format not in export_mimetypes:
+        return jsonify({"error": "The 'format' argument must be ndjson or csv."}), 400
+    # without a content length the response is sent with chunked encoding
+    return Response(
+        stream_with_context(export_houses(request.args, format)),
+        mimetype=export_mimetypes[format],
+    )
+
+@app.route('/properties/stats', methods=['GET'])
+def api_get_market_stats():
+    if request.args.get("group_by", "state_code") not in stats_levels:
+        return jsonify({"error": "The 'group_by' argument must be state_code, city or zip_code."}), 400
     return jsonify({
-        "total": pagination.total,
-        "pages": pagination.pages,
-        "current_page": pagination.page,
-        "per_page": pagination.per_page,
         "results": [
-            house_to_dict(h) for h in pagination.items
+            market_stats_to_dict(s) for s in get_market_stats(request.args)
         ]
     })
 
+@app.route('/properties/facets', methods=['GET'])
+def api_get_property_facets():
+    return jsonify(get_facets(request.args))
+
+def batch_keys(name):
+    """the list of keys in the json body or an error response"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return None, (jsonify({"error": "The body must be a JSON object."}), 400)
+    keys = body.get(name)
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        return None, (jsonify({"error": f"'{name}' must be a list of strings."}), 400)
+    max_keys = app.config["BATCH_MAX_KEYS"]
+    if len(keys) > max_keys:
+        return None, (jsonify({"error": f"at most {max_keys} {name} per request."}), 400)
+    return keys, None
+
+@app.route('/properties/batch', methods=['POST'])
+def api_get_properties_batch():
+    house_ids, error = batch_keys("ids")
+    if error:
+        return error
+    houses = get_houses(house_ids)
+    # one query for the demographics of all the houses
+    demographics = get_demographics(h.zip_code for h in houses.values())
+    results = []
+    for house_id in house_ids:
+        house = houses.get(house_id)
+        if house is not None:
+            result = house_to_dict(house)
+            if house.zip_code in demographics:
+                result["zip_info"] = demographics[house.zip_code]
+            results.append(result)
+    return jsonify({
+        "results": results,
+        "missing": [i for i in house_ids if i not in houses],
+    })
+
 @app.route('/properties/<string:house_id>', methods=['GET'])
+@cached_response
 def api_get_property_by_id(house_id):
-    house = db.session.get(House, house_id)
+    house = None
+    if is_house_id(house_id):
+        house = db.session.get(House, house_id)
 
     if not house:
         return jsonify({"error": "Property not found"}), 404
@@ -153,7 +486,33 @@ def api_get_property_by_id(house_id):
 
     return jsonify(response)
 
+@app.route('/demographics/batch', methods=['POST'])
+def api_get_demographics_batch():
+    zip_codes, error = batch_keys("zip_codes")
+    if error:
+        return error
+    demographics = get_demographics(zip_codes)
+    return jsonify({
+        "results": [demographics[z] for z in zip_codes if z in demographics],
+        "missing": [z for z in zip_codes if z not in demographics],
+    })
+
+@app.route('/autocomplete', methods=['GET'])
+@cached_response
+def api_get_autocomplete():
+    field = request.args.get("field", "city")
+    if field not in name_fields:
+        return jsonify({"error": "The 'field' argument must be city, state or street."}), 400
+    prefix = request.args.get("prefix", "")
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    return jsonify({"results": search_names(field, prefix, limit)})
+
+@app.route('/metrics', methods=['GET'])
+def api_get_metrics():
+    return Response(render_metrics(page_pool_stats()), mimetype="text/plain; version=0.0.4")
+
 @app.route('/demographics/<string:zip_code>', methods=['GET'])
+@cached_response
 def api_get_demographic(zip_code):
     demographic = get_demographic(zip_code)
     if demographic and demographic.get("median_income") is not None:
@@ -161,18 +520,76 @@ def api_get_demographic(zip_code):
     else:
         return jsonify({"error": f"no data found for zip_code {zip_code}"}), 404
 
+def scrape_options(command):
+    """the options of the commands that scrape zipwho.com"""
+    options = [
+        click.option("--concurrency", default=4, help="pages scraped at the same time"),
+        click.option("--rate", default=2.0, help="max requests per second, 0 for no limit"),
+        click.option("--batch-size", default=100, help="zip codes written per transaction"),
+        click.option("--max-attempts", default=3, help="skip zip codes that failed this many times"),
+        click.option("--backend", type=click.Choice(["http", "browser"]), default=None,
+                     help="http only opens the browser for pages without the table, SCRAPE_BACKEND by default"),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+def run_scraper(zip_codes, checkpoint, concurrency, rate, batch_size, backend, **kwargs):
+    backend = backend or app.config["SCRAPE_BACKEND"]
+    pool = PagePool(size=concurrency)
+    if backend == "http":
+        pool = HttpPool(pool)
+
+    async def scrap():
+        try:
+            return await scrape_zip_codes(
+                pool,
+                zip_codes,
+                checkpoint,
+                concurrency=concurrency,
+                rate=rate,
+                batch_size=batch_size,
+                **kwargs,
+            )
+        finally:
+            await pool.close()
+
+    report = asyncio.run(scrap())
+    bump_generation()
+    print(f"Scrap finished: {report.summary()}")
+    print("Pages by path: " + ", ".join(f"{path} {count}" for path, count in sorted(pool.paths.items())))
+
 @app.cli.command("scrap-zip")
-def command_scrap_zip():
-    stmt = select(distinct(House.zip_code))
-    zip_codes = db.session.execute(stmt).scalars()
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        for zip_code in zip_codes:
-            # it reuses the same browser and page
-            # object to scrap the zip code
-            demographic = get_demographic(zip_code, page)
-            print(zip_code, demographic)
+@scrape_options
+def command_scrap_zip(concurrency, rate, batch_size, max_attempts, backend):
+    # creates the tables and columns added since the database was initialized
+    create_tables()
+    checkpoint = Checkpoint(os.path.join(basedir, "scrap-zip.checkpoint.json"))
+    zip_codes = pending_zip_codes(checkpoint, max_attempts)
+    print(f"{len(zip_codes)} zip codes to scrap")
+    run_scraper(zip_codes, checkpoint, concurrency, rate, batch_size, backend)
+
+@app.cli.command("refresh-demographics")
+@scrape_options
+@click.option("--max-requests", default=1000, help="zip codes scraped at most")
+@click.option("--max-seconds", default=3600, help="no zip code is started after this many seconds, 0 for no limit")
+def command_refresh_demographics(concurrency, rate, batch_size, max_attempts, backend, max_requests, max_seconds):
+    """Scrape again the stale zip codes, the ones with more houses first."""
+    create_tables()
+    checkpoint = Checkpoint(os.path.join(basedir, "refresh-demographics.checkpoint.json"))
+    zip_codes = stale_zip_codes(
+        checkpoint,
+        max_attempts,
+        app.config["DEMOGRAPHIC_TTL"],
+        app.config["DEMOGRAPHIC_NEGATIVE_TTL"],
+        limit=max_requests,
+    )
+    print(f"{len(zip_codes)} zip codes to refresh")
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    run_scraper(
+        zip_codes, checkpoint, concurrency, rate, batch_size, backend,
+        write=refresh_demographics, deadline=deadline,
+    )
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
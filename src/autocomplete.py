@@ -0,0 +1,132 @@
+from collections import Counter
+from sqlalchemy import DDL, String, column, event, text
+
+from src.conf import db
+
+# the house columns with type-ahead
+name_fields = ["city", "state", "street"]
+
+class HouseName(db.Model):
+    """the distinct values of name_fields and their number of listings"""
+    __tablename__ = "house_name"
+    __table_args__ = (db.UniqueConstraint("field", "value"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    field = db.Column(db.String(20))
+    value = db.Column(db.String(120))
+    count = db.Column(db.Integer)
+
+def fts_table(field):
+    return f"house_name_{field}_fts"
+
+# an fts5 index of the values of each field, so a match only reads the
+# names of its field, the rows stay in house_name and the prefixes of 1
+# to 3 characters are indexed for the first keystrokes, the events of
+# the metadata run on every create_all so the indexes are also added
+# to a database created before them
+for field in name_fields:
+    event.listen(db.metadata, "after_create", DDL(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table(field)} "
+        "USING fts5(value, content='', prefix='1 2 3')"
+    ))
+    event.listen(db.metadata, "after_drop", DDL(f"DROP TABLE IF EXISTS {fts_table(field)}"))
+
+def build_house_names(conn):
+    """rebuilds the names and their index from the house table"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM house_name")
+    # the index shared by all the fields before
+    cursor.execute("DROP TABLE IF EXISTS house_name_fts")
+    for field in name_fields:
+        cursor.execute(
+            f"INSERT INTO house_name (field, value, count) "
+            f"SELECT '{field}', {field}, count(*) FROM house "
+            f"WHERE {field} IS NOT NULL AND {field} != '' GROUP BY {field}"
+        )
+        fts = fts_table(field)
+        cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('delete-all')")
+        cursor.execute(
+            f"INSERT INTO {fts} (rowid, value) SELECT id, value FROM house_name WHERE field = ?",
+            (field,),
+        )
+    conn.commit()
+
+def is_house_names_built(conn):
+    """the names and their indexes have rows, a database from before the indexes doesn't"""
+    return all(
+        conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+        for table in ["house_name", fts_table(name_fields[0])]
+    )
+
+def update_house_names(conn, rows):
+    """adds rows of (city, state, street) of new houses to the counts"""
+    counts = Counter(
+        (field, value)
+        for row in rows
+        for field, value in zip(name_fields, row)
+        if value
+    )
+    cursor = conn.cursor()
+    last_id, = cursor.execute("SELECT coalesce(max(id), 0) FROM house_name").fetchone()
+    cursor.executemany(
+        "INSERT INTO house_name (field, value, count) VALUES (?, ?, ?) "
+        "ON CONFLICT (field, value) DO UPDATE SET count = count + excluded.count",
+        [(field, value, count) for (field, value), count in counts.items()],
+    )
+    # only the names that were not there get an id past the last one
+    for field in name_fields:
+        cursor.execute(
+            f"INSERT INTO {fts_table(field)} (rowid, value) "
+            "SELECT id, value FROM house_name WHERE id > ? AND field = ?",
+            (last_id, field),
+        )
+    conn.commit()
+
+def match_expression(prefix):
+    """
+    an fts5 query for the names with words starting with the words of
+    prefix, in order, so "san fr" matches "South San Francisco"
+    """
+    words = prefix.split()
+    if not words:
+        return None
+    # quoted so the words are not read as fts5 operators
+    return '"%s" *' % " ".join(words).replace('"', '""')
+
+def names_sql(field, columns):
+    fts = fts_table(field)
+    return (
+        f"SELECT {columns} FROM {fts} "
+        f"JOIN house_name ON house_name.id = {fts}.rowid "
+        f"WHERE {fts} MATCH :expression"
+    )
+
+def search_names(field, prefix, limit=None):
+    """
+    the values of field matching prefix and their number of
+    listings, the ones with more listings first
+    """
+    expression = match_expression(prefix)
+    if expression is None:
+        return []
+    sql = names_sql(field, "house_name.value, house_name.count") + " ORDER BY house_name.count DESC, house_name.value"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    rows = db.session.execute(text(sql), {"expression": expression})
+    return [{"value": value, "count": count} for value, count in rows]
+
+def match_names(field, prefix):
+    """all the values of field matching prefix"""
+    return [name["value"] for name in search_names(field, prefix)]
+
+def names_subquery(field, prefix):
+    """
+    the values of field matching prefix as a subquery, an IN list of
+    all of them could have more variables than sqlite allows
+    """
+    expression = match_expression(prefix)
+    if expression is None:
+        return None
+    return text(names_sql(field, "house_name.value")).bindparams(expression=expression).columns(
+        column("value", String)
+    )
@@ -1,14 +1,277 @@
-
+import time
+import atexit
+import asyncio
+import threading
+from collections import Counter
+import requests
+from lxml import html
+from requests.adapters import HTTPAdapter
 from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+
+from src.flask_config import config
+from src.metrics import record_scrape
+
+# the selectors only need the html, everything else is wasted bandwidth
+blocked_resource_types = {"image", "stylesheet", "font", "media"}
+
+async def block_resources(route):
+    if route.request.resource_type in blocked_resource_types:
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def launch_chromium():
+    playwright = await async_playwright().start()
+    browser = await playwright.chromium.launch(headless=True)
+    return playwright, browser
+
+class PagePool:
+    """
+    a browser that stays alive and a bounded pool of pages leased one
+    request at a time, pages are recycled after max_uses requests or
+    after an error and the browser is relaunched if it crashed
+
+    it has to be used from a single event loop
+    """
+
+    def __init__(self, size=4, max_uses=100, launch=launch_chromium):
+        self.size = size
+        self.max_uses = max_uses
+        self.launch = launch
+        self.playwright = None
+        self.browser = None
+        self.slots = None
+        self.waiting = 0
+        self.in_use = 0
+        # requests served by each path, see HttpPool
+        self.paths = Counter()
+
+    async def open(self):
+        self.slots = asyncio.Queue()
+        for _ in range(self.size):
+            # pages are created the first time the slot is leased
+            self.slots.put_nowait((None, 0))
+
+    async def new_page(self):
+        if self.browser is None or not self.browser.is_connected():
+            await self.close_browser()
+            self.playwright, self.browser = await self.launch()
+        page = await self.browser.new_page()
+        await page.route("**/*", block_resources)
+        return page
+
+    async def goto_and_select(self, full_url, selector):
+        if self.slots is None:
+            await self.open()
+        self.paths["browser"] += 1
+        self.waiting += 1
+        try:
+            page, uses = await self.slots.get()
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        try:
+            if page is None or page.is_closed():
+                page, uses = await self.new_page(), 0
+            await page.goto(full_url)
+            await page.wait_for_selector(selector, timeout=10000)
+            return await page.inner_html(selector)
+        except Exception:
+            # the page may be in a broken state so it is replaced
+            uses = self.max_uses
+            raise
+        finally:
+            uses += 1
+            if page is not None and uses >= self.max_uses:
+                await self.close_page(page)
+                page, uses = None, 0
+            self.in_use -= 1
+            self.slots.put_nowait((page, uses))
+
+    async def close_page(self, page):
+        try:
+            await page.close()
+        except Exception:
+            pass
+
+    async def close_browser(self):
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.playwright = None
+        self.browser = None
+
+    async def close(self):
+        await self.close_browser()
+        self.slots = None
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+        }
+
+def selector_xpath(selector):
+    """the xpath of a tag#id selector, the only ones zipwho.com needs"""
+    tag, _, element_id = selector.partition("#")
+    return f"//{tag or '*'}[@id='{element_id}']"
+
+def select_inner_html(content, selector):
+    """the inner html of the element of selector or None if it's missing"""
+    elements = html.fromstring(content).xpath(selector_xpath(selector))
+    if not elements:
+        return None
+    element = elements[0]
+    return (element.text or "") + "".join(
+        html.tostring(child, encoding="unicode") for child in element
+    )
+
+class HttpFetcher:
+    """
+    gets the pages with a keep-alive session and selects the table
+    with lxml, without a browser, when the table is in the html
+    """
+
+    def __init__(self, pool_size=8, timeout=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Mozilla/5.0 (compatible; houses-search-api)"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, full_url, selector):
+        """the inner html of selector or None when the page renders it with javascript"""
+        response = self.session.get(full_url, timeout=self.timeout)
+        response.raise_for_status()
+        return select_inner_html(response.content, selector)
+
+    def close(self):
+        self.session.close()
+
+class HttpPool:
+    """
+    the interface of PagePool answered by an HttpFetcher, the pages
+    without the table are loaded by the fallback PagePool, which only
+    launches the browser the first time it's needed
+    """
+
+    def __init__(self, fallback, fetcher=None):
+        self.fallback = fallback
+        self.fetcher = fetcher or HttpFetcher(pool_size=fallback.size)
+        self.paths = Counter()
+
+    async def goto_and_select(self, full_url, selector):
+        content = await asyncio.to_thread(self.fetcher.fetch, full_url, selector)
+        if content is not None:
+            self.paths["http"] += 1
+            return content
+        self.paths["fallback"] += 1
+        return await self.fallback.goto_and_select(full_url, selector)
+
+    async def close(self):
+        self.fetcher.close()
+        await self.fallback.close()
+
+    def stats(self):
+        return {**self.fallback.stats(), "paths": dict(self.paths)}
+
+class ThreadedPagePool:
+    """
+    runs a PagePool in an event loop of its own thread so that it
+    can be shared by all the threads of the process
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="page-pool", daemon=True
+        )
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def goto_and_select(self, full_url, selector):
+        return self.run(self.pool.goto_and_select(full_url, selector))
+
+    def stats(self):
+        return self.pool.stats()
+
+    def close(self):
+        self.run(self.pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+page_pool = None
+page_pool_lock = threading.Lock()
+
+def get_page_pool():
+    global page_pool
+    with page_pool_lock:
+        if page_pool is None:
+            page_pool = ThreadedPagePool(PagePool(
+                size=config["BROWSER_POOL_SIZE"],
+                max_uses=config["BROWSER_PAGE_MAX_USES"],
+            ))
+        return page_pool
+
+def page_pool_stats():
+    """the stats of the page pool of the process or None before the first browser scrape"""
+    with page_pool_lock:
+        return page_pool.stats() if page_pool is not None else None
+
+@atexit.register
+def close_page_pool():
+    global page_pool
+    with page_pool_lock:
+        if page_pool is not None:
+            page_pool.close()
+            page_pool = None
+
+http_fetcher = None
+http_fetcher_lock = threading.Lock()
+
+def get_http_fetcher():
+    global http_fetcher
+    with http_fetcher_lock:
+        if http_fetcher is None:
+            http_fetcher = HttpFetcher(
+                pool_size=config["SCRAPE_HTTP_POOL_SIZE"],
+                timeout=config["SCRAPE_HTTP_TIMEOUT"],
+            )
+        return http_fetcher
 
-def goto_and_select(full_url, selector, page=None):
-    if page is not None:
-        page.goto(full_url)
-        page.wait_for_selector(selector, timeout=10000)
-        return page.inner_html(selector)
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        page.goto(full_url)
-        page.wait_for_selector(selector, timeout=10000)
-        return page.inner_html(selector)
\ No newline at end of file
+def goto_and_select(full_url, selector, page=None, backend=None):
+    """
+    the inner html of selector in the page of full_url, with the http
+    backend the browser only loads the pages missing the element
+    """
+    backend = backend or config["SCRAPE_BACKEND"]
+    start = time.perf_counter()
+    path = "browser"
+    try:
+        content = None
+        if backend == "http" and page is None:
+            path = "http"
+            content = get_http_fetcher().fetch(full_url, selector)
+            if content is None:
+                path = "fallback"
+        if content is None and page is not None:
+            page.goto(full_url)
+            page.wait_for_selector(selector, timeout=10000)
+            content = page.inner_html(selector)
+        elif content is None:
+            content = get_page_pool().goto_and_select(full_url, selector)
+    except Exception:
+        record_scrape(time.perf_counter() - start, error=True, path=path)
+        raise
+    record_scrape(time.perf_counter() - start, path=path)
+    return content
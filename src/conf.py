@@ -1,5 +1,9 @@
+import os
+from contextlib import contextmanager
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import Session
 
 from src.flask_config import config, basedir, db_path
 
@@ -10,6 +14,78 @@ for key, val in config.items():
 
 db = SQLAlchemy(app)
 
+def set_read_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    # the connection can't write even if the file allows it
+    cursor.execute("PRAGMA query_only = ON;")
+    # reads pages from the memory mapped file instead of copying them
+    cursor.execute(f"PRAGMA mmap_size = {app.config['SQLITE_MMAP_SIZE']};")
+    cursor.execute(f"PRAGMA cache_size = {app.config['SQLITE_CACHE_SIZE']};")
+    # sorts and temporary indexes stay in memory
+    cursor.execute("PRAGMA temp_store = MEMORY;")
+    cursor.close()
+
+def set_write_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    # waits for the writer process instead of failing
+    cursor.execute("PRAGMA busy_timeout = 5000;")
+    cursor.execute("PRAGMA synchronous = NORMAL;")
+    cursor.close()
+
+writer_engine = None
+
+if app.config["SQLITE_PROFILE"] == "serving":
+    with app.app_context():
+        event.listen(db.engine, "connect", set_read_pragmas)
+    # the few writes of the API, like caching a scraped zip code,
+    # go through a single connection that can write
+    writer_engine = create_engine("sqlite:///" + db_path, pool_size=1, max_overflow=0)
+    event.listen(writer_engine, "connect", set_write_pragmas)
+
+# the file behind db_path when the connections were opened, an
+# import with --shadow points db_path to a new file
+database_realpath = os.path.realpath(db_path)
+
+def follow_database_swap():
+    """closes the connections to a replaced database, True if it was"""
+    global database_realpath
+    realpath = os.path.realpath(db_path)
+    if realpath == database_realpath:
+        return False
+    database_realpath = realpath
+    # the connections in use are closed when they are returned
+    db.engine.dispose()
+    if writer_engine is not None:
+        writer_engine.dispose()
+    return True
+
+@contextmanager
+def write_session():
+    """a session that can write, even when the API connections are read only"""
+    if writer_engine is None:
+        yield db.session
+        return
+    with Session(writer_engine) as session:
+        yield session
+
+def create_tables():
+    """
+    creates the missing tables and adds the columns and indexes added
+    to the models since the database was created, create_all only
+    creates tables that don't exist
+    """
+    db.create_all()
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            # the indexes of those columns
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
 state_map = {
     "Alabama": "AL",
     "Alaska": "AK",
@@ -1,7 +1,10 @@
-from contextlib import suppress
-from sqlalchemy.exc import IntegrityError
+import time
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from src.conf import db
+from src.conf import db, write_session
+from src.metrics import record_cache
 from src.zipwho import get_result_table_cells, table_values, table_parse
 
 class Demographic(db.Model):
@@ -23,6 +26,11 @@ class Demographic(db.Model):
     black = db.Column(db.Float)
     asian = db.Column(db.Float)
     hispanic_ethnicity = db.Column(db.Float)
+    # unix time of the last scrape, NULL for rows scraped before it was kept
+    scraped_at = db.Column(db.Float)
+    # increased by every write of the values, the search engine
+    # reloads when the largest one changes
+    revision = db.Column(db.Integer, index=True)
 
 demographic_attrs = [
     "median_income",
@@ -50,11 +58,75 @@ def demographic_to_dict(demographic):
         k: getattr(demographic, k) for k in demographic_attrs
     }
 
+# the columns written by a scrape
+scraped_columns = demographic_attrs[:-1] + ["scraped_at"]
+
+def next_revision():
+    # evaluated by the write itself, sqlite has one writer at a time so
+    # the revisions grow in the order the writes are committed
+    return select(func.coalesce(func.max(Demographic.revision), 0) + 1).scalar_subquery()
+
+def write_demographics(session, rows, replace=False):
+    """
+    inserts the scraped rows, a row of a zip code that is already in
+    the table is skipped or, with replace, gets the new values
+    """
+    if not rows:
+        return
+    table = Demographic.__table__
+    # the rows without data only have zip_code and scraped_at
+    rows = [
+        {"zip_code": row["zip_code"], **{name: row.get(name) for name in scraped_columns}}
+        for row in rows
+    ]
+    statement = sqlite_insert(table).values(revision=next_revision())
+    if replace:
+        statement = statement.on_conflict_do_update(
+            index_elements=["zip_code"],
+            set_={name: statement.excluded[name] for name in scraped_columns + ["revision"]},
+        )
+    else:
+        statement = statement.on_conflict_do_nothing()
+    session.execute(statement, rows)
+
+def is_negative(demographic):
+    # stored without values when zipwho.com had no data
+    return demographic.median_income is None and demographic.population is None
+
+def is_expired(demographic, now=None):
+    """
+    a negative row is scraped again after DEMOGRAPHIC_NEGATIVE_TTL
+    seconds, zipwho.com may only have failed that time, the rows with
+    values are refreshed by refresh-demographics instead
+    """
+    if not is_negative(demographic):
+        return False
+    if demographic.scraped_at is None:
+        return True
+    now = time.time() if now is None else now
+    return now - demographic.scraped_at >= current_app.config["DEMOGRAPHIC_NEGATIVE_TTL"]
+
+def get_demographics(zip_codes, chunk_size=500):
+    """
+    the demographics of zip_codes found in the table by zip code,
+    read with one query per chunk and without scraping
+    """
+    zip_codes = list(dict.fromkeys(zip_codes))
+    demographics = {}
+    for i in range(0, len(zip_codes), chunk_size):
+        chunk = zip_codes[i:i + chunk_size]
+        for demographic in Demographic.query.filter(Demographic.zip_code.in_(chunk)):
+            if not is_negative(demographic):
+                demographics[demographic.zip_code] = demographic_to_dict(demographic)
+    return demographics
+
 def get_demographic(zip_code, page=None):
     demographic = db.session.get(Demographic, zip_code)
-    if demographic and demographic.median_income is None and demographic.population is None:
+    hit = demographic is not None and not is_expired(demographic)
+    record_cache("demographic", hit)
+    if hit and is_negative(demographic):
         return
-    if demographic:
+    if hit:
         return demographic_to_dict(demographic)
     table_cells = get_result_table_cells(zip_code, page)
     values = table_values(table_cells)
@@ -65,9 +137,9 @@ def get_demographic(zip_code, page=None):
         # insert demographic without any values
         # so that next time it returns immediately
         parsed = {"zip_code": zip_code}
-    with suppress(IntegrityError):
-        new_demographic = Demographic(**parsed)
-        db.session.add(new_demographic)
-        db.session.commit()
+    with write_session() as session:
+        # replaces an expired negative row
+        write_demographics(session, [{**parsed, "scraped_at": time.time()}], replace=True)
+        session.commit()
     if values:
         return parsed
\ No newline at end of file
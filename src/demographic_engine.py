@@ -0,0 +1,168 @@
+from collections import defaultdict
+import numpy as np
+from flask import current_app
+from sqlalchemy import text, func, select
+
+from src.conf import db
+from src.demographic import Demographic
+from src.zipwho import table_attributes, demographic_ranges, scrape_zips_by_demographics
+from src.zip_search_cache import cached_zip_search
+from src.http_cache import get_generation
+
+class DemographicEngine:
+    """
+    answers the demographic search of zipwho.com from the Demographic table
+
+    the 17 attributes are kept in a float32 matrix with one row per
+    attribute, the zip codes are sorted by state so each state is a
+    contiguous slice given by offsets, and a search evaluates all the
+    range predicates of the slice as one boolean mask
+
+    house_zips has the state codes of each zip code of the houses and
+    known the ones that were scraped, even if zipwho had no data
+    """
+
+    def __init__(self, zip_codes, state_codes, values, house_zips, known, revision):
+        self.house_zips = house_zips
+        self.known = known
+        self.revision = revision
+
+        zip_codes = np.asarray(zip_codes, dtype=str)
+        state_codes = np.asarray(state_codes, dtype=str)
+        order = np.lexsort((zip_codes, state_codes))
+        self.zip_codes = zip_codes[order]
+        self.state_codes = state_codes[order]
+        self.values = np.asarray(values, dtype=np.float32).reshape(
+            len(zip_codes), len(table_attributes)
+        )[order].T.copy()
+        self.columns = {attr: i for i, attr in enumerate(table_attributes)}
+
+        self.offsets = {}
+        states, starts, counts = np.unique(
+            self.state_codes, return_index=True, return_counts=True
+        )
+        for state, start, count in zip(states, starts, counts):
+            self.offsets[str(state)] = (int(start), int(start + count))
+
+        totals = defaultdict(int)
+        known_counts = defaultdict(int)
+        for zip_code, house_states in house_zips.items():
+            for state in house_states:
+                totals[state] += 1
+                known_counts[state] += zip_code in known
+        self.coverage = {state: known_counts[state] / total for state, total in totals.items()}
+
+    def updated(self, demographics, revision):
+        """
+        a new engine with the rows written since this one was loaded,
+        only the arrays are copied, the house table isn't read again
+        """
+        keep = ~np.isin(self.zip_codes, list(demographics))
+        zip_codes = self.zip_codes[keep].tolist()
+        state_codes = self.state_codes[keep].tolist()
+        values = [self.values.T[keep]]
+        for zip_code, row_values, state in engine_rows(demographics, self.house_zips):
+            zip_codes.append(zip_code)
+            state_codes.append(state)
+            values.append([row_values])
+        known = self.known | (demographics.keys() & self.house_zips.keys())
+        return DemographicEngine(
+            zip_codes, state_codes, np.concatenate(values),
+            self.house_zips, known, revision,
+        )
+
+    def search(self, state_code, ranges):
+        start, end = self.offsets.get(state_code, (0, 0))
+        mask = np.ones(end - start, dtype=bool)
+        for attr, attr_min, attr_max in ranges:
+            column = self.values[self.columns[attr], start:end]
+            # NaN never passes a comparison so unknown values are excluded
+            if attr_min is not None:
+                mask &= column >= attr_min
+            if attr_max is not None:
+                mask &= column <= attr_max
+        return self.zip_codes[start:end][mask].tolist()
+
+def read_demographics(after=None):
+    """
+    the values of the demographic rows by zip code, None when zipwho
+    had no data, only the rows with a revision after after if given,
+    and the largest revision read
+    """
+    columns = ", ".join(table_attributes)
+    sql = f"SELECT zip_code, revision, {columns} FROM demographic"
+    if after is not None:
+        sql += " WHERE revision > :after"
+    demographics = {}
+    revision = after or 0
+    for zip_code, row_revision, *values in db.session.execute(text(sql), {"after": after}):
+        revision = max(revision, row_revision or 0)
+        row = dict(zip(table_attributes, values))
+        # see is_negative
+        if row["median_income"] is None and row["population"] is None:
+            demographics[zip_code] = None
+        else:
+            demographics[zip_code] = [np.nan if value is None else value for value in values]
+    return demographics, revision
+
+def engine_rows(demographics, house_zips):
+    """(zip code, values, state code) of the rows searched by the engine"""
+    for zip_code, values in demographics.items():
+        if values is None:
+            continue
+        # the Demographic table has no state so it comes from the houses
+        for state in house_zips.get(zip_code, ()):
+            yield zip_code, values, state
+
+def load_demographic_engine():
+    house_zips = defaultdict(list)
+    for zip_code, state_code in db.session.execute(text(
+        "SELECT DISTINCT zip_code, state_code FROM house"
+    )):
+        house_zips[zip_code].append(state_code or "")
+    house_zips = dict(house_zips)
+    demographics, revision = read_demographics()
+    rows = list(engine_rows(demographics, house_zips))
+    return DemographicEngine(
+        [row[0] for row in rows],
+        [row[2] for row in rows],
+        [row[1] for row in rows],
+        house_zips,
+        demographics.keys() & house_zips.keys(),
+        revision,
+    )
+
+# the engine is loaded once and loaded again when the data generation
+# changes, the demographic rows written since then are added to it
+engine = None
+engine_generation = None
+
+def get_demographic_engine():
+    global engine, engine_generation
+    generation = get_generation()
+    if engine is None or generation != engine_generation:
+        engine = load_demographic_engine()
+        engine_generation = generation
+        return engine
+    revision = db.session.execute(select(func.max(Demographic.revision))).scalar() or 0
+    if revision > engine.revision:
+        engine = engine.updated(*read_demographics(engine.revision))
+    return engine
+
+def reset_demographic_engine():
+    global engine, engine_generation
+    engine = None
+    engine_generation = None
+
+def get_zips_by_demographics(args):
+    """
+    searches the Demographic table and falls back to scraping
+    zipwho.com when the state doesn't have enough zip codes scraped
+    """
+    state_code = args.get("state_code")
+    ranges = demographic_ranges(args)
+    demographic_engine = get_demographic_engine()
+    min_coverage = current_app.config["DEMOGRAPHIC_ENGINE_MIN_COVERAGE"]
+    if demographic_engine.coverage.get(state_code, 0.0) >= min_coverage:
+        return demographic_engine.search(state_code, ranges)
+    return cached_zip_search(state_code, ranges, scrape_zips_by_demographics)
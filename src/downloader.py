@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# bytes of each range request, the blocks are requested in order so
+# the start of the file completes first and can already be imported
+block_size = 8 * 1024 * 1024
+
+# the longest line expected in the csv
+max_line_size = 1024 * 1024
+
+class DownloadError(Exception):
+    pass
+
+def file_digest(path, name):
+    digest = hashlib.new(name)
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(block_size), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+class Download:
+    """
+    downloads url into path with connections parallel range requests,
+    the data goes to path.part and the blocks already written are
+    saved in path.download.json so an interrupted download resumes
+    where it stopped, finish checks the checksum and renames the file
+    """
+
+    def __init__(self, url, path, connections=8, block_size=block_size, sha256=None):
+        self.url = url
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.state_path = f"{path}.download.json"
+        self.connections = connections
+        self.block_size = block_size
+        self.sha256 = sha256
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.thread = None
+        self.error = None
+        # bytes from the start of the file that are written
+        self.prefix = 0
+
+    def session(self):
+        # a requests session is not shared between threads
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def head(self):
+        response = self.session().head(self.url, allow_redirects=True)
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        self.size = int(length) if length is not None else None
+        self.etag = response.headers.get("ETag")
+        self.ranges = response.headers.get("Accept-Ranges") == "bytes" and self.size is not None
+
+    def load_state(self):
+        """the blocks written by a previous run of the same file"""
+        self.done = set()
+        try:
+            with open(self.state_path) as file:
+                state = json.load(file)
+        except (FileNotFoundError, ValueError):
+            state = None
+        same_file = state is not None and os.path.exists(self.part_path) and (
+            state["url"], state["size"], state["etag"], state["block_size"]
+        ) == (self.url, self.size, self.etag, self.block_size)
+        if same_file:
+            self.done = set(state["done"])
+        else:
+            with open(self.part_path, "wb") as file:
+                file.truncate(self.size)
+        self.advance_prefix()
+
+    def save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({
+                "url": self.url,
+                "size": self.size,
+                "etag": self.etag,
+                "block_size": self.block_size,
+                "done": sorted(self.done),
+            }, file)
+        os.replace(temp_path, self.state_path)
+
+    def block_count(self):
+        return -(-self.size // self.block_size)
+
+    def advance_prefix(self):
+        index = self.prefix // self.block_size
+        while index in self.done:
+            index += 1
+        self.prefix = min(index * self.block_size, self.size)
+
+    def fetch_block(self, index):
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self.etag:
+            # the whole file instead of the range if it changed meanwhile
+            headers["If-Range"] = self.etag
+        # streamed so the whole file sent for a failed If-Range is never read
+        with self.session().get(self.url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise DownloadError(f"{self.url} changed during the download")
+            content = response.content
+        if len(content) != end - start + 1:
+            raise DownloadError(f"block {index} of {self.url} is incomplete")
+        with open(self.part_path, "r+b") as file:
+            file.seek(start)
+            file.write(content)
+        with self.changed:
+            self.done.add(index)
+            self.advance_prefix()
+            self.save_state()
+            self.changed.notify_all()
+
+    def fetch_all(self):
+        """one request for servers without ranges, it can't resume"""
+        with self.session().get(self.url, stream=True) as response:
+            response.raise_for_status()
+            with open(self.part_path, "r+b") as file:
+                for data in response.iter_content(chunk_size=1024 * 1024):
+                    file.write(data)
+                    file.flush()
+                    with self.changed:
+                        self.prefix += len(data)
+                        self.changed.notify_all()
+        with self.changed:
+            self.size = self.prefix
+            self.changed.notify_all()
+
+    def prepare(self):
+        """creates path.part before it's written so it can be read"""
+        if self.ranges:
+            self.load_state()
+        else:
+            # the size is only known at the end
+            self.size = float("inf")
+            open(self.part_path, "wb").close()
+
+    def run(self):
+        try:
+            if self.ranges:
+                pending = [i for i in range(self.block_count()) if i not in self.done]
+                if len(pending) < self.block_count():
+                    print(f"resuming, {len(pending)} of {self.block_count()} blocks left")
+                with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                    futures = [executor.submit(self.fetch_block, i) for i in pending]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except Exception:
+                        for future in futures:
+                            future.cancel()
+                        raise
+            else:
+                self.fetch_all()
+        except Exception as error:
+            # raised by wait_for and finish in the thread that reads
+            with self.changed:
+                self.error = error
+                self.changed.notify_all()
+
+    def start(self):
+        """downloads in a thread so the file can be read as it arrives"""
+        self.head()
+        self.prepare()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def wait_for(self, offset):
+        """waits until the first offset bytes of the file are written"""
+        with self.changed:
+            while self.prefix < min(offset, self.size) and self.error is None:
+                self.changed.wait()
+            if self.error is not None:
+                raise DownloadError(f"download of {self.url} failed: {self.error}")
+
+    def line_ranges(self, start, size):
+        """
+        ranges of about size bytes from start that end after a new
+        line like split_ranges, each one once its bytes are written
+        """
+        with open(self.part_path, "rb") as file:
+            while start < self.size:
+                end = start + size
+                self.wait_for(end + max_line_size)
+                if end >= self.size:
+                    yield start, self.size
+                    return
+                file.seek(end)
+                line = file.readline(max_line_size)
+                if not line.endswith(b"\n") and end + len(line) < self.size:
+                    raise DownloadError(f"a line at byte {end} is longer than {max_line_size} bytes")
+                yield start, end + len(line)
+                start = end + len(line)
+
+    def expected_digest(self):
+        if self.sha256:
+            return "sha256", self.sha256.lower()
+        # S3 uses the md5 of the file as ETag unless it was uploaded in parts
+        etag = (self.etag or "").strip('"')
+        if re.fullmatch(r"[0-9a-f]{32}", etag):
+            return "md5", etag
+        return None
+
+    def finish(self):
+        """checks the file and moves it to path"""
+        if self.thread is not None:
+            self.thread.join()
+        if self.error is not None:
+            raise DownloadError(f"download of {self.url} failed: {self.error}")
+        expected = self.expected_digest()
+        if expected is not None:
+            name, digest = expected
+            if file_digest(self.part_path, name) != digest:
+                # the blocks are wrong, the next run downloads all of them again
+                if os.path.exists(self.state_path):
+                    os.remove(self.state_path)
+                raise DownloadError(f"the {name} of {self.url} is not {digest}")
+            print(f"{name} verified")
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def download(self):
+        self.head()
+        self.prepare()
+        self.run()
+        self.finish()
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from sqlalchemy import String, case, cast, func, select, text
+from sqlalchemy.dialects import sqlite
+
+from src.conf import db
+from src.house import House, filter_house_query, house_filters, paging_args
+
+facet_names = ["status", "state_code", "bed", "bath", "price"]
+
+# upper bounds of the price bands, the last band has no upper bound
+price_bands = [100000, 200000, 300000, 400000, 500000, 750000, 1000000, 2000000]
+
+# houses with more beds or baths are counted together
+max_rooms = 6
+
+# the arguments answered by the house_facet table
+facet_table_args = {"status", "state"}
+
+class HouseFacet(db.Model):
+    """the number of houses of each facet value by status and state"""
+    __tablename__ = "house_facet"
+
+    status = db.Column(db.String(30), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    facet = db.Column(db.String(20), primary_key=True)
+    # empty when the house has no value
+    value = db.Column(db.String(40), primary_key=True)
+    count = db.Column(db.Integer)
+
+def band_label(low, high):
+    return f"{low}-{high}" if high is not None else f"{low}+"
+
+price_band_labels = [
+    band_label(low, high)
+    for low, high in zip([0] + price_bands, price_bands + [None])
+]
+
+def room_bucket(column):
+    # the importer keeps empty values as text
+    return case(
+        (func.typeof(column).not_in(["integer", "real"]), ""),
+        (column >= max_rooms, f"{max_rooms}+"),
+        else_=cast(cast(column, db.Integer), String),
+    )
+
+def price_band(column):
+    return case(
+        (column.is_(None), ""),
+        *[(column < high, label) for high, label in zip(price_bands, price_band_labels)],
+        else_=price_band_labels[-1],
+    )
+
+# the value of each facet for a house, the same sql for the table and the scan
+facet_columns = {
+    "status": func.coalesce(House.status, ""),
+    "state_code": func.coalesce(House.state_code, ""),
+    "bed": room_bucket(House.bed),
+    "bath": room_bucket(House.bath),
+    "price": price_band(House.price),
+}
+
+def facet_groups_sql(where=None):
+    """
+    counts the houses by state and every facet in one grouped scan,
+    in sql for the sqlite3 connections of the importer
+    """
+    columns = [func.coalesce(House.state, "")] + list(facet_columns.values())
+    statement = select(*columns, func.count()).group_by(*columns)
+    if where is not None:
+        statement = statement.where(text(where))
+    return str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+def add_facet_groups(cursor, where=None, parameters=()):
+    counts = defaultdict(int)
+    for state, *values, count in cursor.execute(facet_groups_sql(where), parameters).fetchall():
+        status = values[0]
+        for facet, value in zip(facet_names, values):
+            counts[(status, state, facet, value)] += count
+    cursor.executemany(
+        "INSERT INTO house_facet (status, state, facet, value, count) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (status, state, facet, value) DO UPDATE SET count = count + excluded.count",
+        [key + (count,) for key, count in counts.items()],
+    )
+
+def build_house_facets(conn):
+    """rebuilds the facet counts with one pass over the houses"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM house_facet")
+    add_facet_groups(cursor)
+    conn.commit()
+
+def update_house_facets(conn, house_ids, chunk_size=500):
+    """adds the houses of house_ids, just inserted, to the facet counts"""
+    cursor = conn.cursor()
+    for i in range(0, len(house_ids), chunk_size):
+        chunk = house_ids[i:i + chunk_size]
+        add_facet_groups(cursor, f"house.id IN ({', '.join('?' for _ in chunk)})", chunk)
+    conn.commit()
+
+def facet_order(facet):
+    """the order of the values in the response"""
+    if facet == "price":
+        return lambda item: price_band_labels.index(item[0]) if item[0] else len(price_band_labels)
+    if facet in ("bed", "bath"):
+        return lambda item: (not item[0], len(item[0]), item[0])
+    return lambda item: (-item[1], item[0])
+
+def facets_to_dict(counts):
+    """counts of (facet, value) as lists of values and counts by facet"""
+    by_facet = {facet: {} for facet in facet_names}
+    for (facet, value), count in counts.items():
+        by_facet[facet][value] = count
+    return {
+        "total": sum(by_facet["status"].values()),
+        "facets": {
+            facet: [
+                # an empty value is a house without one
+                {"value": value or None, "count": count}
+                for value, count in sorted(values.items(), key=facet_order(facet))
+                if count
+            ]
+            for facet, values in by_facet.items()
+        },
+    }
+
+def is_facet_table_query(args):
+    return all(
+        key in facet_table_args
+        for key, value in args.items()
+        if value and key not in paging_args
+    )
+
+def facets_from_table(args):
+    query = db.session.query(HouseFacet.facet, HouseFacet.value, func.sum(HouseFacet.count))
+    for name in facet_table_args:
+        if args.get(name):
+            query = query.filter(getattr(HouseFacet, name) == args.get(name))
+    rows = query.group_by(HouseFacet.facet, HouseFacet.value).all()
+    return {(facet, value): count for facet, value, count in rows}
+
+def facets_from_scan(args):
+    query = filter_house_query(args, house_filters(args))
+    columns = list(facet_columns.values())
+    rows = query.with_entities(*columns, func.count()).group_by(*columns).all()
+    counts = defaultdict(int)
+    for *values, count in rows:
+        for facet, value in zip(facet_names, values):
+            counts[(facet, value)] += count
+    return counts
+
+def get_facets(args):
+    """
+    the counts of every facet for the filters of /properties,
+    status and state filters are read from house_facet and any
+    other filter counts the matching houses in a single scan
+    """
+    is_built = db.session.execute(text("SELECT 1 FROM house_facet LIMIT 1")).first()
+    if is_built and is_facet_table_query(args):
+        return facets_to_dict(facets_from_table(args))
+    return facets_to_dict(facets_from_scan(args))
@@ -3,7 +3,59 @@ import os
 basedir = os.getcwd()
 db_path = os.path.join(basedir, 'database.db')
 
+# default or serving, see "Serving the API" in the README
+sqlite_profile = os.environ.get('SQLITE_PROFILE', 'default')
+
 config = {
     'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
     'SQLALCHEMY_TRACK_MODIFICATIONS': False,
-}
\ No newline at end of file
+    'SQLITE_PROFILE': sqlite_profile,
+    # connections of a worker, one per thread serving requests
+    'SQLITE_POOL_SIZE': int(os.environ.get('SQLITE_POOL_SIZE', 4)),
+    # read path settings of the serving profile, the database file is
+    # memory mapped and each connection caches 64MB of pages
+    'SQLITE_MMAP_SIZE': 1024 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': -64000,
+    # share of a state's zip codes that must be scraped before
+    # demographic searches are answered from the Demographic table
+    'DEMOGRAPHIC_ENGINE_MIN_COVERAGE': 0.99,
+    # seconds after which a scraped zip code is refreshed by
+    # refresh-demographics, and a zip code without data is scraped
+    # again by the next request
+    'DEMOGRAPHIC_TTL': 90 * 24 * 3600,
+    'DEMOGRAPHIC_NEGATIVE_TTL': 7 * 24 * 3600,
+    # zipwho.com searches kept in the zip_search_cache table
+    'ZIP_SEARCH_CACHE_SIZE': 10000,
+    'ZIP_SEARCH_CACHE_TTL': 7 * 24 * 3600,
+    # pages kept open by the shared browser and requests served by
+    # a page before it is closed and replaced
+    'BROWSER_POOL_SIZE': 4,
+    'BROWSER_PAGE_MAX_USES': 100,
+    # http gets the zipwho.com pages with a keep-alive session and only
+    # opens the browser when the table isn't in the html, or browser
+    'SCRAPE_BACKEND': os.environ.get('SCRAPE_BACKEND', 'http'),
+    'SCRAPE_HTTP_POOL_SIZE': 8,
+    'SCRAPE_HTTP_TIMEOUT': 10,
+    # sql or columnar, columnar filters /properties with numpy arrays
+    # memory mapped from HOUSE_COLUMNS_PATH that import-csv rebuilds
+    'HOUSE_ENGINE': 'sql',
+    'HOUSE_COLUMNS_PATH': os.path.join(basedir, 'house_columns'),
+    # seconds clients and proxies may reuse a response and responses
+    # kept in memory by each process, 0 disables the memory cache
+    'HTTP_CACHE_MAX_AGE': 300,
+    'HTTP_RESPONSE_CACHE_SIZE': 1024,
+    # keys accepted by the batch endpoints
+    'BATCH_MAX_KEYS': 5000,
+    # statements slower than this are logged with their query plan,
+    # None disables the log
+    'SLOW_QUERY_SECONDS': 0.5,
+}
+
+if sqlite_profile == 'serving':
+    # the API only reads, the imports run in a separate writer process
+    config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///file:{db_path}?mode=ro&uri=true'
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': config['SQLITE_POOL_SIZE'],
+        'max_overflow': 0,
+        'pool_pre_ping': False,
+    }
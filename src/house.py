@@ -1,10 +1,71 @@
-from flask import request, jsonify
+import io
+import csv
+import json
+import base64
+import time
+import binascii
+from collections import OrderedDict
+from math import ceil, isfinite
+import numpy as np
+from flask import abort, current_app, request, jsonify
+from sqlalchemy import and_, false, literal, or_, tuple_
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
 
 from src.conf import db
-from src.zipwho import get_zips_by_demographics
+from src.demographic_engine import get_zips_by_demographics
+from src.house_engine import get_house_columns
+from src.http_cache import get_generation
+from src.metrics import record_cache
+from src.autocomplete import match_names, names_subquery
+
+# composite indexes matching the filter shapes used by /properties
+# status is always given so it leads every index
+house_indexes = {
+    "ix_house_status_state_code_price": ("status", "state_code", "price"),
+    "ix_house_status_state_price": ("status", "state", "price"),
+    "ix_house_status_zip_code": ("status", "zip_code"),
+    "ix_house_status_city": ("status", "city"),
+    "ix_house_status_price": ("status", "price"),
+    # sort=price_per_sq_ft reads the index in order instead of sorting
+    "ix_house_status_price_per_sq_ft": ("status", "price_per_sq_ft"),
+}
+
+class HexBinary(db.TypeDecorator):
+    """
+    a hex string in python stored as bytes in the database,
+    the sha256 ids take 32 bytes instead of 64 characters
+    """
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return bytes.fromhex(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return value.hex()
+
+def is_house_id(value):
+    if not isinstance(value, str):
+        return False
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        return False
+    return True
 
 class House(db.Model):
-    id = db.Column(db.String(120), primary_key=True, unique=True)
+    # without rowid the table is stored in the primary key b-tree
+    # so there is no second b-tree to keep in sync
+    __table_args__ = tuple(
+        db.Index(name, *columns) for name, columns in house_indexes.items()
+    ) + ({"sqlite_with_rowid": False},)
+
+    id = db.Column(HexBinary, primary_key=True)
     brokered_by = db.Column(db.String(120))
     status = db.Column(db.String(30))
     price = db.Column(db.Float)
@@ -42,60 +103,428 @@ house_attrs = [
     'zip_code',
 ]
 
+def create_house_indexes(cursor):
+    for name, columns in house_indexes.items():
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON house ({', '.join(columns)})"
+        )
+
+def drop_house_indexes(cursor):
+    for name in house_indexes:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+def house_table_sql(cursor):
+    """the CREATE TABLE of house or None if there is no house table"""
+    row = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'house'"
+    ).fetchone()
+    return row[0] if row else None
+
+def is_house_migrated(cursor):
+    return "WITHOUT ROWID" in house_table_sql(cursor).upper()
+
+def migrate_house_ids(conn):
+    """
+    copies a house table with hex text ids into the WITHOUT ROWID
+    table with binary ids and rebuilds the indexes
+    """
+    cursor = conn.cursor()
+    conn.create_function("unhex_id", 1, bytes.fromhex, deterministic=True)
+    drop_house_indexes(cursor)
+    cursor.execute("ALTER TABLE house RENAME TO house_old")
+    cursor.execute(str(CreateTable(House.__table__).compile(dialect=sqlite.dialect())))
+    columns = [c.name for c in House.__table__.columns if c.name != "id"]
+    cursor.execute(
+        f"INSERT INTO house (id, {', '.join(columns)}) "
+        f"SELECT unhex_id(id), {', '.join(columns)} FROM house_old"
+    )
+    cursor.execute("DROP TABLE house_old")
+    create_house_indexes(cursor)
+    cursor.execute("ANALYZE")
+    conn.commit()
+    # gives the space of the old table back to the file system
+    cursor.execute("VACUUM")
+
+def house_lookup_latency(cursor, samples=1000):
+    """average seconds to get a house by its primary key"""
+    ids = [row[0] for row in cursor.execute(
+        "SELECT id FROM house ORDER BY random() LIMIT ?", (samples,)
+    )]
+    started_at = time.perf_counter()
+    for house_id in ids:
+        cursor.execute("SELECT * FROM house WHERE id = ?", (house_id,)).fetchone()
+    return (time.perf_counter() - started_at) / max(len(ids), 1)
+
 def house_to_dict(house):
     return {
         k: getattr(house, k) for k in house_attrs
     }
 
-def filter_by_range(args, query, name, type):
-    min_value = args.get(f'min_{name}', type=type)
-    max_value = args.get(f'max_{name}', type=type)
+# the argument name, the column and the type of each range filter
+range_filters = [
+    ("price", "price", float),
+    ("bed", "bed", int),
+    ("bath", "bath", int),
+    ("acre_lot", "acre_lot", int),
+    ("price_per_acre", "price_per_acre", int),
+    ("house_size", "house_size", int),
+    ("price_per_sqft", "price_per_sq_ft", int),
+]
 
-    if min_value is not None:
-        query = query.filter(getattr(House, name) >= min_value)
-    if max_value is not None:
-        query = query.filter(getattr(House, name) <= max_value)
+exact_match_attrs = ["city", "state", "zip_code", "state_code"]
 
-    return query
+def house_filters(args):
+    """
+    the filters of /properties parsed once so the SQL query and
+    the columnar engine apply exactly the same ones
+    """
+    ranges = []
+    for name, column, type in range_filters:
+        min_value = args.get(f'min_{name}', type=type)
+        max_value = args.get(f'max_{name}', type=type)
+        if min_value is not None or max_value is not None:
+            ranges.append((column, min_value, max_value))
+
+    exact = []
+    for name in exact_match_attrs:
+        value = args.get(name, type=str)
+        if value is not None:
+            exact.append((name, value))
 
-def filter_by_exact_match(args, query, name, type):
-    value = args.get(name, type=type)
+    # as requirements only filters by demographics if state_code is given
+    # state_code is required for demographics search
+    zips = None
+    if args.get("state_code") is not None:
+        zips = get_zips_by_demographics(args)
 
-    if value is not None:
+    return {
+        "status": args.get('status', type=str),
+        "ranges": ranges,
+        "exact": exact,
+        "zips": zips,
+        # the cities whose name has words starting like city_prefix
+        "city_prefix": args.get("city_prefix", type=str) or None,
+    }
+
+def filter_house_query(args, filters=None):
+    if filters is None:
+        filters = house_filters(args)
+
+    query = House.query
+    # /properties requires status, /properties/facets counts every status
+    if filters["status"] is not None:
+        query = query.filter(House.status == filters["status"])
+
+    for name, min_value, max_value in filters["ranges"]:
+        if min_value is not None:
+            query = query.filter(getattr(House, name) >= min_value)
+        if max_value is not None:
+            query = query.filter(getattr(House, name) <= max_value)
+
+    for name, value in filters["exact"]:
         query = query.filter(getattr(House, name) == value)
 
+    if filters["zips"] is not None:
+        query = query.filter(House.zip_code.in_(filters["zips"]))
+
+    if filters["city_prefix"] is not None:
+        names = names_subquery("city", filters["city_prefix"])
+        query = query.filter(House.city.in_(names) if names is not None else false())
+
     return query
 
-def get_house_by_property(args):
-    query = House.query
+# arguments that select a page but don't change the filtered set
+paging_args = {"page", "per_page", "cursor", "total", "sort"}
+
+# the columns /properties can be sorted by, -price sorts descending,
+# ties are sorted by id in the same direction
+sort_keys = ["price", "price_per_sq_ft", "price_per_acre", "house_size", "acre_lot", "bed", "bath"]
+
+def parse_sort(args):
+    """(column name, descending) of the sort argument, False if it's invalid"""
+    sort = args.get("sort", type=str)
+    if not sort:
+        return None
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in sort_keys:
+        return False
+    return name, descending
+
+def order_by_sort(query, sort):
+    if sort is None:
+        return query.order_by(House.id)
+    name, descending = sort
+    if descending:
+        return query.order_by(getattr(House, name).desc(), House.id.desc())
+    return query.order_by(getattr(House, name), House.id)
+
+def seek_after(sort, values):
+    """
+    the rows after the last row of the previous page, SQLite sorts
+    NULL before any value and a row value comparison with NULL is
+    never true so NULL keys have their own conditions
+    """
+    house_id = values[-1]
+    if sort is None:
+        return House.id > house_id
+    name, descending = sort
+    column = getattr(House, name)
+    value = values[-2]
+    # the values of a tuple_ don't take the type of the columns,
+    # without it the id would be compared as text and not as bytes
+    key = tuple_(literal(value, column.type), literal(house_id, House.id.type))
+    if descending:
+        if value is None:
+            return and_(column.is_(None), House.id < house_id)
+        return or_(tuple_(column, House.id) < key, column.is_(None))
+    if value is None:
+        return or_(and_(column.is_(None), House.id > house_id), column.is_not(None))
+    return tuple_(column, House.id) > key
+
+def house_cursor(house, sort):
+    if sort is None:
+        return encode_cursor([house.id])
+    return encode_cursor([getattr(house, sort[0]), house.id])
+
+# total count per data generation and filter signature, used by total=estimate
+count_cache = OrderedDict()
+count_cache_size = 1024
+
+def filter_signature(args):
+    return tuple(sorted(
+        (k, v) for k, v in args.items() if k not in paging_args
+    ))
 
+def count_total(args, query, mode):
+    if mode == "none":
+        return None
+    if mode == "exact":
+        return query.order_by(None).count()
+    # every import bumps the generation, so no worker keeps
+    # the totals of the data before it
+    signature = (get_generation(), filter_signature(args))
+    if signature in count_cache:
+        count_cache.move_to_end(signature)
+        record_cache("count", True)
+        return count_cache[signature]
+    record_cache("count", False)
+    total = query.order_by(None).count()
+    count_cache[signature] = total
+    if len(count_cache) > count_cache_size:
+        count_cache.popitem(last=False)
+    return total
+
+def encode_cursor(values):
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+# the importer keeps bed and bath as they are in the csv so the
+# empty ones are text, the other sort keys are numbers
+text_sort_keys = {"bed", "bath"}
+
+def is_sort_value(name, value):
+    if value is None or isinstance(value, str):
+        return value is None or name in text_sort_keys
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and isfinite(value)
+
+def decode_cursor(cursor, sort=None):
+    """the values of house_cursor or None if the cursor is invalid"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != (1 if sort is None else 2):
+        return None
+    if not is_house_id(values[-1]):
+        return None
+    if sort is not None and not is_sort_value(sort[0], values[0]):
+        return None
+    return values
+
+class CursorPage:
+
+    def __init__(self, items, per_page, total, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.total = total
+        self.next_cursor = next_cursor
+
+def paginate_by_cursor(query, cursor, per_page, total, sort=None):
+    """
+    keyset pagination, the cursor holds the sort key and id of the
+    last row of the previous page so the next page seeks with
+    WHERE (key, id) > (?, ?) instead of scanning an OFFSET
+    """
+    query = order_by_sort(query, sort)
+
+    if cursor:
+        values = decode_cursor(cursor, sort)
+        if values is None:
+            return jsonify({"error": "The 'cursor' argument is invalid."}), 400
+        query = query.filter(seek_after(sort, values))
+
+    items = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = house_cursor(items[-1], sort)
+
+    return CursorPage(items, per_page, total, next_cursor)
+
+class ListPage:
+    """a page of the columnar engine with the fields of a Pagination"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 0
+        return ceil(self.total / self.per_page)
+
+def get_houses(house_ids, chunk_size=500):
+    """the houses of house_ids by id, read with one query per chunk"""
+    house_ids = list(dict.fromkeys(i for i in house_ids if is_house_id(i)))
+    houses = {}
+    for i in range(0, len(house_ids), chunk_size):
+        chunk = house_ids[i:i + chunk_size]
+        for house in House.query.filter(House.id.in_(chunk)):
+            houses[house.id] = house
+    return houses
+
+def houses_by_ids(house_ids):
+    """the houses of house_ids in the same order"""
+    houses = {
+        house.id: house
+        for house in House.query.filter(House.id.in_(house_ids))
+    }
+    return [houses[house_id] for house_id in house_ids if house_id in houses]
+
+def search_house_columns(args, filters, page, per_page, cursor, total_mode, sort=None):
+    """
+    /properties answered by the columnar engine, the rows are filtered
+    in memory and only the houses of the page are read from SQLite
+    """
+    columns = get_house_columns(current_app.config["HOUSE_COLUMNS_PATH"])
+
+    # the engine filters the cities in memory with a list of names
+    cities = None
+    if filters["city_prefix"] is not None:
+        cities = match_names("city", filters["city_prefix"])
+    positions = columns.search({**filters, "cities": cities})
+    # the count of the engine is exact and free
+    total = None if total_mode == "none" else len(positions)
+
+    if cursor is not None:
+        if cursor:
+            values = decode_cursor(cursor, sort)
+            if values is None:
+                return jsonify({"error": "The 'cursor' argument is invalid."}), 400
+            if sort is None:
+                start = np.searchsorted(positions, columns.position_after(values[-1]))
+                positions = positions[start:]
+            else:
+                positions = columns.seek_after(positions, sort, values[-2], values[-1])
+        if sort is not None:
+            positions = columns.top(positions, sort, per_page + 1)
+        items = houses_by_ids(columns.house_ids(positions[:per_page]))
+        next_cursor = None
+        if len(positions) > per_page:
+            next_cursor = house_cursor(items[-1], sort)
+        return CursorPage(items, per_page, total, next_cursor)
+
+    # 404 like the paginate of the SQL engine
+    if page < 1:
+        abort(404)
+    start = (page - 1) * per_page
+    if sort is not None:
+        positions = columns.top(positions, sort, start + per_page)
+    items = houses_by_ids(columns.house_ids(positions[start:start + per_page]))
+    if not items and page != 1:
+        abort(404)
+    return ListPage(items, page, per_page, total)
+
+def get_house_by_property(args):
     status = args.get('status', type=str)
     if not status:
         return jsonify({"error": "The 'status' argument is required."}), 400
-    query = query.filter(House.status == status)
-
-    query = filter_by_range(args, query, "price", float)
-    query = filter_by_range(args, query, "bed", int)
-    query = filter_by_range(args, query, "bath", int)
-    query = filter_by_range(args, query, "acre_lot", int)
-    query = filter_by_range(args, query, "price_per_acre", int)
-    query = filter_by_range(args, query, "house_size", int)
-    query = filter_by_range(args, query, "price_per_sqft", int)
-
-    query = filter_by_exact_match(args, query, "city", type=str)
-    query = filter_by_exact_match(args, query, "state", type=str)
-    query = filter_by_exact_match(args, query, "zip_code", type=str)
-    # state_code is required for demographics search
-    query = filter_by_exact_match(args, query, "state_code", type=str)
 
-    # as requirements only filters by demographics if state_code is given
-    if args.get("state_code") is not None:
-        zips = get_zips_by_demographics(args)
-        query = query.filter(House.zip_code.in_(zips))
+    total_mode = args.get('total', 'exact', type=str)
+    if total_mode not in ("exact", "estimate", "none"):
+        return jsonify({"error": "The 'total' argument must be exact, estimate or none."}), 400
+
+    sort = parse_sort(args)
+    if sort is False:
+        return jsonify({"error": f"The 'sort' argument must be one of {', '.join(sort_keys)} with an optional -."}), 400
+
+    filters = house_filters(args)
+    per_page = min(max(args.get('per_page', 20, type=int), 1), 500)
+    cursor = args.get('cursor', type=str)
+
+    if current_app.config["HOUSE_ENGINE"] == "columnar":
+        page = args.get('page', 1, type=int)
+        return search_house_columns(args, filters, page, per_page, cursor, total_mode, sort)
+
+    query = filter_house_query(args, filters)
+
+    if cursor is not None:
+        total = count_total(args, query, total_mode)
+        return paginate_by_cursor(query, cursor, per_page, total, sort)
+
+    # without a sort the rows come in the order of the index so the
+    # whole filtered set is never sorted, with one and a LIMIT SQLite
+    # keeps only the first rows while sorting, or reads them in order
+    # from an index that ends with the key
+    if sort is not None:
+        query = order_by_sort(query, sort)
 
     # supports pagination
     page = args.get('page', 1, type=int)
-    per_page = args.get('per_page', 20, type=int)
-    pagination = query.paginate(page=page, per_page=per_page, max_per_page=500)
+    pagination = query.paginate(
+        page=page,
+        per_page=per_page,
+        max_per_page=500,
+        count=total_mode == "exact",
+    )
+    if total_mode == "estimate":
+        pagination.total = count_total(args, query, total_mode)
 
     return pagination
+
+
+# rows fetched from the cursor at a time and bytes sent per chunk
+export_batch_size = 1000
+export_chunk_size = 64 * 1024
+
+def export_houses(args, format):
+    """
+    yields the houses matching the filters of /properties as ndjson
+    or csv, the rows come from a server side cursor so memory stays
+    the same no matter how many rows match
+    """
+    query = filter_house_query(args).with_entities(
+        *[getattr(House, name) for name in house_attrs]
+    )
+    rows = query.execution_options(yield_per=export_batch_size)
+
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(house_attrs)
+    for row in rows:
+        if format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(house_attrs, row))))
+            buffer.write("\n")
+        if buffer.tell() >= export_chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
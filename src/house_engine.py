@@ -0,0 +1,206 @@
+import os
+import json
+import shutil
+from array import array
+
+import numpy as np
+
+numeric_columns = [
+    "price",
+    "bed",
+    "bath",
+    "acre_lot",
+    "house_size",
+    "price_per_acre",
+    "price_per_sq_ft",
+]
+
+# low cardinality columns, a bitmap per value
+bitmap_columns = ["status", "state", "state_code"]
+
+# high cardinality columns, only the codes
+code_columns = ["city", "zip_code"]
+
+def numeric_value(value):
+    if value is None:
+        return np.nan
+    # the importer keeps empty values as text and sqlite sorts text
+    # after any number, so text passes >= and fails <= like in SQL
+    if isinstance(value, str):
+        return np.inf
+    return value
+
+def build_house_columns(conn, path, batch_size=100000):
+    """
+    writes the columns of the house table as numpy files in the
+    directory path, rows are sorted by id like the table
+    """
+    temp_path = f"{path}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    ids = bytearray()
+    numeric = {name: array("d") for name in numeric_columns}
+    codes = {name: array("i") for name in bitmap_columns + code_columns}
+    dictionaries = {name: {} for name in bitmap_columns + code_columns}
+
+    names = ["id"] + numeric_columns + bitmap_columns + code_columns
+    cursor = conn.execute(f"SELECT {', '.join(names)} FROM house ORDER BY id")
+    for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+        for row in rows:
+            house_id = row[0]
+            ids += bytes.fromhex(house_id) if isinstance(house_id, str) else house_id
+            for name, value in zip(names[1:], row[1:]):
+                if name in numeric:
+                    numeric[name].append(numeric_value(value))
+                else:
+                    dictionary = dictionaries[name]
+                    codes[name].append(dictionary.setdefault(value, len(dictionary)))
+
+    count = len(ids) // 32
+    np.save(os.path.join(temp_path, "id.npy"), np.frombuffer(bytes(ids), dtype="S32"))
+    for name, values in numeric.items():
+        np.save(os.path.join(temp_path, f"{name}.npy"), np.frombuffer(values, dtype=np.float64))
+    for name, values in codes.items():
+        values = np.frombuffer(values, dtype=np.int32)
+        np.save(os.path.join(temp_path, f"{name}.npy"), values)
+        if name in bitmap_columns:
+            bitmaps = np.stack([
+                np.packbits(values == code) for code in range(len(dictionaries[name]))
+            ]) if dictionaries[name] else np.zeros((0, 0), dtype=np.uint8)
+            np.save(os.path.join(temp_path, f"{name}.bitmaps.npy"), bitmaps)
+
+    with open(os.path.join(temp_path, "meta.json"), "w") as file:
+        json.dump({
+            "count": count,
+            # json keys are strings so the dictionaries are lists
+            "dictionaries": {name: list(d) for name, d in dictionaries.items()},
+        }, file)
+
+    # workers that still map the old files keep reading them
+    # until they reload, the files are unlinked but not gone
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(temp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return count
+
+class HouseColumns:
+    """
+    the house columns memory mapped from the files of
+    build_house_columns so every worker shares the same pages
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        self.mtime = os.stat(meta_path).st_mtime_ns
+        with open(meta_path) as file:
+            meta = json.load(file)
+        self.count = meta["count"]
+        self.dictionaries = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in meta["dictionaries"].items()
+        }
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.ids = load("id")
+        self.columns = {
+            name: load(name) for name in numeric_columns + bitmap_columns + code_columns
+        }
+        self.bitmaps = {name: load(f"{name}.bitmaps") for name in bitmap_columns}
+
+    def is_stale(self):
+        try:
+            return os.stat(os.path.join(self.path, "meta.json")).st_mtime_ns != self.mtime
+        except FileNotFoundError:
+            return True
+
+    def equals(self, name, value):
+        code = self.dictionaries[name].get(value)
+        if code is None:
+            return np.zeros(self.count, dtype=bool)
+        if name in self.bitmaps:
+            return np.unpackbits(self.bitmaps[name][code], count=self.count).view(bool)
+        return self.columns[name] == code
+
+    def mask(self, filters):
+        mask = self.equals("status", filters["status"])
+        for name, value in filters["exact"]:
+            mask &= self.equals(name, value)
+        for name, min_value, max_value in filters["ranges"]:
+            column = self.columns[name]
+            if min_value is not None:
+                mask &= column >= min_value
+            if max_value is not None:
+                mask &= column <= max_value
+        for name, values in (("zip_code", filters["zips"]), ("city", filters["cities"])):
+            if values is not None:
+                dictionary = self.dictionaries[name]
+                codes = [dictionary[v] for v in values if v in dictionary]
+                mask &= np.isin(self.columns[name], codes)
+        return mask
+
+    def search(self, filters):
+        """positions of the matching rows in id order"""
+        return np.flatnonzero(self.mask(filters))
+
+    def position_after(self, house_id):
+        """position of the first row with an id greater than house_id"""
+        return np.searchsorted(self.ids, np.bytes_(bytes.fromhex(house_id)), side="right")
+
+    def sort_values(self, positions, sort):
+        """
+        the keys of positions ordered like SQLite, NULL (nan) first and
+        text (inf) last, negated when descending so smaller is first
+        """
+        name, descending = sort
+        values = np.nan_to_num(self.columns[name][positions], nan=-np.inf, posinf=np.inf, neginf=-np.inf)
+        return -values if descending else values
+
+    def top(self, positions, sort, count):
+        """
+        the first count positions in the order of sort with ties by id,
+        argpartition finds them without sorting all the positions
+        """
+        if count < len(positions):
+            values = self.sort_values(positions, sort)
+            kth = np.partition(values, count - 1)[count - 1]
+            # every row tied with the last one stays so the id decides
+            positions = positions[values <= kth]
+        values = self.sort_values(positions, sort)
+        ids = -positions if sort[1] else positions
+        return positions[np.lexsort((ids, values))][:count]
+
+    def seek_after(self, positions, sort, value, house_id):
+        """
+        the positions after the row (value, house_id) in the order of
+        sort, for the cursor of a sorted search
+        """
+        values = self.sort_values(positions, sort)
+        value = numeric_value(value)
+        value = -np.inf if np.isnan(value) else value
+        house_id = np.bytes_(bytes.fromhex(house_id))
+        if sort[1]:
+            value = -value
+            after_id = positions < np.searchsorted(self.ids, house_id, side="left")
+        else:
+            after_id = positions >= np.searchsorted(self.ids, house_id, side="right")
+        return positions[(values > value) | ((values == value) & after_id)]
+
+    def house_ids(self, positions):
+        raw = self.ids.view(np.uint8).reshape(-1, 32)
+        return [raw[position].tobytes().hex() for position in positions]
+
+# the columns are mapped once and mapped again after a rebuild
+house_columns = None
+
+def get_house_columns(path):
+    global house_columns
+    if house_columns is None or house_columns.path != path or house_columns.is_stale():
+        house_columns = HouseColumns(path)
+    return house_columns
@@ -0,0 +1,86 @@
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import current_app, make_response, request
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.conf import db
+from src.metrics import record_cache
+
+class DataGeneration(db.Model):
+    """a counter bumped by the commands that change the data"""
+    __tablename__ = "data_generation"
+
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer)
+
+def get_generation():
+    try:
+        generation = db.session.get(DataGeneration, 1)
+    except OperationalError:
+        # the database was initialized before the table existed
+        db.session.rollback()
+        return 0
+    return generation.generation if generation else 0
+
+bump_generation_sql = (
+    "INSERT INTO data_generation (id, generation) VALUES (1, 1) "
+    "ON CONFLICT (id) DO UPDATE SET generation = generation + 1"
+)
+
+def bump_generation():
+    db.session.execute(text(bump_generation_sql))
+    db.session.commit()
+
+def normalized_url():
+    """the path and the query arguments sorted, so their order doesn't matter"""
+    args = "&".join(
+        f"{k}={v}" for k, v in sorted(request.args.items(multi=True))
+    )
+    return f"{request.path}?{args}"
+
+# the responses of this process by normalized url
+response_cache = OrderedDict()
+response_cache_lock = threading.Lock()
+
+def cached_response(view):
+    """
+    gives the responses of view a strong etag built from the data
+    generation and the url, answers If-None-Match with 304 and keeps
+    the last HTTP_RESPONSE_CACHE_SIZE responses in memory
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = get_generation()
+        url = normalized_url()
+        etag = f"{generation}-{hashlib.sha256(url.encode()).hexdigest()[:16]}"
+
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            with response_cache_lock:
+                cached = response_cache.get(url)
+                if cached is not None and cached[0] == generation:
+                    response_cache.move_to_end(url)
+            hit = cached is not None and cached[0] == generation
+            record_cache("response", hit)
+            if hit:
+                response = make_response(cached[1], 200, {"Content-Type": cached[2]})
+            else:
+                response = make_response(view(*args, **kwargs))
+                cache_size = current_app.config["HTTP_RESPONSE_CACHE_SIZE"]
+                if response.status_code == 200 and cache_size:
+                    with response_cache_lock:
+                        response_cache[url] = (generation, response.get_data(), response.content_type)
+                        response_cache.move_to_end(url)
+                        while len(response_cache) > cache_size:
+                            response_cache.popitem(last=False)
+
+        if response.status_code in (200, 304):
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config["HTTP_CACHE_MAX_AGE"]
+        return response
+    return wrapper
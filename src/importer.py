@@ -0,0 +1,401 @@
+import io
+import os
+import bz2
+import csv
+import sys
+import gzip
+import lzma
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from src.conf import state_map, to_float
+
+# bytes of the csv file parsed by a worker at a time
+chunk_size = 16 * 1024 * 1024
+
+# buffer of the decompressed stream
+stream_buffer_size = 4 * 1024 * 1024
+
+def db_optimization(cursor):
+    journal_mode, = cursor.execute("PRAGMA journal_mode;").fetchone()
+    if journal_mode == "wal":
+        # the API may be reading the database (see enable-wal) so
+        # the journal stays on and the file is not locked
+        cursor.execute("PRAGMA synchronous = NORMAL;")
+        cursor.execute("PRAGMA cache_size = -1000000;")
+        cursor.execute("PRAGMA busy_timeout = 5000;")
+        return
+    # Disables rollback log
+    cursor.execute("PRAGMA journal_mode = OFF;")
+    # Doesn't wait for disk write confirmation
+    cursor.execute("PRAGMA synchronous = OFF;")
+    # Uses 1GB of RAM for cache
+    cursor.execute("PRAGMA cache_size = -1000000;")
+    # Prevents other apps from touching DB
+    cursor.execute("PRAGMA locking_mode = EXCLUSIVE;")
+
+def insert_house(cursor, buffer):
+    cursor.executemany(
+        "INSERT OR IGNORE INTO house (brokered_by, status, price, bed, bath, acre_lot, street, city, state, zip_code, house_size, prev_sold_date, state_code, price_per_acre, price_per_sq_ft, id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        buffer
+    )
+
+def parse_line(raw_line):
+    """the row to insert for a line of the csv or None to skip it"""
+    raw_line = raw_line.strip()
+    if not raw_line:
+        return None
+
+    row_hash = hashlib.sha256(raw_line.encode('utf-8')).digest()
+
+    columns = next(csv.reader([raw_line]))
+
+    state = columns[8]
+    state_code = state_map.get(state, "")
+    columns.append(state_code)
+
+    price = to_float(columns[2])
+    if price is None or price <= 0:
+        return None
+    columns[2] = price
+
+    acre_lot = to_float(columns[5]) or 0
+    columns[5] = acre_lot
+    price_per_acre = 0 if acre_lot == 0 else price / acre_lot
+    columns.append(price_per_acre)
+
+    house_size = to_float(columns[10]) or 0
+    columns[10] = house_size
+    price_per_sq_ft = 0 if house_size == 0 else price / house_size
+    columns.append(price_per_sq_ft)
+
+    columns.append(row_hash)
+    return columns
+
+def parse_data(data):
+    """parses bytes made of complete lines"""
+    rows = []
+    for raw_line in data.decode('utf-8').split("\n"):
+        columns = parse_line(raw_line)
+        if columns is not None:
+            rows.append(columns)
+    return rows, len(data)
+
+def parse_range(path, start, end):
+    """parses the lines between the byte offsets start and end"""
+    with open(path, mode='rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return parse_data(data)
+
+def split_ranges(path, start, size=chunk_size):
+    """
+    splits the file from start into ranges of about size bytes,
+    every range ends right after a new line so no line is cut
+    """
+    file_size = os.path.getsize(path)
+    ranges = []
+    with open(path, mode='rb') as file:
+        while start < file_size:
+            file.seek(min(start + size, file_size))
+            file.readline()
+            end = min(file.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def header_end(path):
+    with open(path, mode='rb') as file:
+        file.readline()
+        return file.tell()
+
+def parse_in_order(function, args, workers):
+    """yields function(*a) for each a of args, in parallel if workers > 1"""
+    if workers <= 1:
+        for a in args:
+            yield function(*a)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # only a few ranges in flight so memory doesn't grow
+        # when the writer is slower than the parsers
+        futures = deque()
+        for a in args:
+            futures.append(executor.submit(function, *a))
+            if len(futures) >= 2 * workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+def parse_ranges(path, ranges, workers):
+    """yields the parsed rows of each range, in parallel if workers > 1"""
+    return parse_in_order(parse_range, ((path, start, end) for start, end in ranges), workers)
+
+def parse_chunks(chunks, workers):
+    """yields the parsed rows of each chunk of lines, in parallel if workers > 1"""
+    return parse_in_order(parse_data, ((data,) for data in chunks), workers)
+
+def open_zstd(path):
+    if zstandard is None:
+        raise ValueError(f"{path} is compressed with zstd, install zstandard to import it")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+
+# the readers of the compressed files by extension
+decompressors = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".zst": open_zstd,
+}
+
+def is_stream(path):
+    """the file can't be read at an offset, it's read once from the start"""
+    return path == "-" or os.path.splitext(path)[1] in decompressors
+
+def open_stream(path):
+    """
+    a binary reader of the csv at path, decompressed by its
+    extension, or of the standard input when path is -
+    """
+    if path == "-":
+        raw = sys.stdin.buffer
+    else:
+        decompressor = decompressors.get(os.path.splitext(path)[1])
+        raw = decompressor(path) if decompressor else open(path, "rb")
+    return io.BufferedReader(raw, buffer_size=stream_buffer_size)
+
+def read_chunks(file, size=chunk_size):
+    """
+    yields chunks of about size bytes of the stream from its
+    second line, every chunk ends after a new line like split_ranges
+    """
+    file.readline()
+    while True:
+        data = file.read(size)
+        if not data:
+            return
+        yield data + file.readline()
+
+# bytes hashed to recognise a file that only grew since the last import
+fingerprint_size = 64 * 1024
+
+def create_manifest_table(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS import_manifest ("
+        "path TEXT PRIMARY KEY, size INTEGER, head_fingerprint TEXT, "
+        "tail_fingerprint TEXT, offset INTEGER)"
+    )
+
+def file_fingerprint(path, start, end):
+    with open(path, mode='rb') as file:
+        file.seek(max(start, 0))
+        return hashlib.sha256(file.read(end - max(start, 0))).hexdigest()
+
+def lines_end(path, end):
+    """the offset right after the last complete line before end"""
+    with open(path, mode='rb') as file:
+        position = end
+        while position > 0:
+            block_start = max(position - 64 * 1024, 0)
+            file.seek(block_start)
+            block = file.read(position - block_start)
+            new_line = block.rfind(b"\n")
+            if new_line != -1:
+                return block_start + new_line + 1
+            position = block_start
+    return 0
+
+def read_manifest(cursor, path):
+    create_manifest_table(cursor)
+    row = cursor.execute(
+        "SELECT size, head_fingerprint, tail_fingerprint, offset "
+        "FROM import_manifest WHERE path = ?",
+        (os.path.abspath(path),),
+    ).fetchone()
+    if row:
+        return dict(zip(("size", "head_fingerprint", "tail_fingerprint", "offset"), row))
+
+def write_manifest(cursor, path, offset):
+    create_manifest_table(cursor)
+    cursor.execute(
+        "INSERT OR REPLACE INTO import_manifest "
+        "(path, size, head_fingerprint, tail_fingerprint, offset) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            os.path.abspath(path),
+            os.path.getsize(path),
+            file_fingerprint(path, 0, min(fingerprint_size, offset)),
+            file_fingerprint(path, offset - fingerprint_size, offset),
+            offset,
+        ),
+    )
+
+def resume_offset(path, manifest):
+    """
+    the offset where the last import stopped if the file only grew
+    since then, or None when it has to be imported again
+    """
+    if manifest is None:
+        return None
+    offset = manifest["offset"]
+    if os.path.getsize(path) < offset:
+        return None
+    if file_fingerprint(path, 0, min(fingerprint_size, offset)) != manifest["head_fingerprint"]:
+        return None
+    if file_fingerprint(path, offset - fingerprint_size, offset) != manifest["tail_fingerprint"]:
+        return None
+    return offset
+
+def existing_house_ids(cursor):
+    return {row[0] for row in cursor.execute("SELECT id FROM house")}
+
+def new_house_rows(cursor, rows, chunk_size=500):
+    """the rows whose id is not in the table yet, without duplicates"""
+    ids = [row[-1] for row in rows]
+    existing = set()
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        existing.update(row[0] for row in cursor.execute(
+            f"SELECT id FROM house WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+        ))
+    new_rows = []
+    for row in rows:
+        if row[-1] not in existing:
+            existing.add(row[-1])
+            new_rows.append(row)
+    return new_rows
+
+def import_csv(conn, path, workers=1, start=None, existing_ids=None, on_rows=None,
+               ranges=None, end=None):
+    """
+    parses the csv in a pool of processes and inserts the rows from
+    this process since sqlite only has one writer at a time
+
+    it starts after the header or at start, rows whose id is in
+    existing_ids are not inserted again, on_rows is called with the
+    rows that were not in the table, it returns the number of rows
+    added and the offset after the last complete line
+
+    ranges and end can be given for a file that is still being
+    written, ranges may be a generator waiting for its bytes and
+    without end the file ends where the last range ends
+    """
+    if start is None:
+        start = header_end(path)
+    if ranges is None:
+        ranges = split_ranges(path, start)
+        end = ranges[-1][1] if ranges else start
+    last_end = start
+
+    def tracked_ranges():
+        nonlocal last_end
+        for range_start, range_end in ranges:
+            last_end = range_end
+            yield range_start, range_end
+
+    def progress(bytes_done):
+        if end is None:
+            print("completed %.1f MB" % (bytes_done / 1024 / 1024))
+        else:
+            print("completed %.2f %%" % (100 * bytes_done / max(end - start, 1)))
+
+    count_added = insert_parsed(
+        conn, parse_ranges(path, tracked_ranges(), workers), existing_ids, on_rows, progress
+    )
+    # a last line without new line may still be written to so
+    # the next import parses it again
+    return count_added, lines_end(path, last_end if end is None else end)
+
+def import_stream(conn, file, workers=1, existing_ids=None):
+    """
+    like import_csv for a stream read once from the start, a
+    decompressed file or the standard input, it returns the number
+    of rows added
+    """
+    def progress(bytes_done):
+        print("completed %.1f MB" % (bytes_done / 1024 / 1024))
+
+    return insert_parsed(
+        conn, parse_chunks(read_chunks(file), workers), existing_ids, None, progress
+    )
+
+def insert_parsed(conn, parsed, existing_ids, on_rows, progress):
+    """inserts the rows of each parsed chunk, see import_csv"""
+    cursor = conn.cursor()
+    bytes_done = 0
+    count_added = 0
+    for rows, bytes_read in parsed:
+        if existing_ids:
+            rows = [row for row in rows if row[-1] not in existing_ids]
+        if on_rows is not None:
+            rows = new_house_rows(cursor, rows)
+            on_rows(rows)
+        insert_house(cursor, rows)
+        conn.commit()
+        count_added += len(rows)
+        bytes_done += bytes_read
+        progress(bytes_done)
+    return count_added
+
+def shadow_db_path(path):
+    """a new versioned file next to the live database"""
+    root, ext = os.path.splitext(path)
+    version = time.strftime('%Y%m%d%H%M%S')
+    new_path = f"{root}.{version}{ext}"
+    number = 1
+    while os.path.lexists(new_path):
+        number += 1
+        new_path = f"{root}.{version}-{number}{ext}"
+    return new_path
+
+def table_columns(cursor, schema, table):
+    return [row[1] for row in cursor.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def copy_tables(conn, path, tables):
+    """copies the rows of tables from the database at path"""
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE ? AS live", (path,))
+    for table in tables:
+        # only the columns of both tables, the live one may be older
+        live_columns = set(table_columns(cursor, "live", table))
+        columns = ", ".join(c for c in table_columns(cursor, "main", table) if c in live_columns)
+        if columns:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO main.{table} ({columns}) SELECT {columns} FROM live.{table}"
+            )
+    conn.commit()
+    cursor.execute("DETACH DATABASE live")
+
+def remove_database(path):
+    """removes a database file and its journal"""
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def swap_database(path, new_path):
+    """
+    points the symlink at path to new_path in one rename, so a
+    connection opens either the old file or the new one, and removes
+    the old file, readers that still have it open keep reading it
+    until they close it since the file is only unlinked
+    """
+    is_link = os.path.islink(path)
+    old_path = os.path.realpath(path) if os.path.exists(path) else None
+    link_path = f"{path}.link"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(new_path), link_path)
+    os.replace(link_path, path)
+    if old_path is None or old_path == os.path.realpath(new_path):
+        return
+    # a regular file was already unlinked by the rename, only its journal is left
+    suffixes = ("", "-wal", "-shm") if is_link else ("-wal", "-shm")
+    for suffix in suffixes:
+        if os.path.exists(old_path + suffix):
+            os.remove(old_path + suffix)
@@ -0,0 +1,227 @@
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+# upper bounds of the buckets, in seconds and in statements
+latency_buckets = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+count_buckets = [0, 1, 2, 5, 10, 20, 50, 100, 500]
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{%s}" % ",".join(f'{n}="{escape_label(v)}"' for n, v in zip(names, values))
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        # the count of each bucket, then the sum and the count
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            values = self.values.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self.lock:
+            for label_values, values in sorted(self.values.items()):
+                for bound, count in zip(self.buckets + ["+Inf"], values[:-2] + [values[-1]]):
+                    labels = format_labels(names, label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {values[-2]}")
+                lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "time to answer a request",
+    latency_buckets, ("endpoint", "method", "status"),
+)
+request_sql_statements = Histogram(
+    "http_request_sql_statements", "sql statements executed by a request",
+    count_buckets, ("endpoint",),
+)
+request_sql_duration = Histogram(
+    "http_request_sql_seconds", "time a request spent executing sql",
+    latency_buckets, ("endpoint",),
+)
+request_scrape_duration = Histogram(
+    "http_request_scrape_seconds", "time a request spent scraping zipwho.com",
+    latency_buckets, ("endpoint",),
+)
+request_serialize_duration = Histogram(
+    "http_request_serialize_seconds", "time a request spent building the json of the results",
+    latency_buckets, ("endpoint",),
+)
+sql_duration = Histogram("sql_statement_duration_seconds", "time to execute a sql statement", latency_buckets)
+slow_queries = Counter("sql_slow_queries_total", "statements slower than SLOW_QUERY_SECONDS")
+scrape_duration = Histogram(
+    "scrape_duration_seconds", "time to load a zipwho.com page",
+    latency_buckets, ("path", "result"),
+)
+scrape_paths = ["http", "fallback", "browser"]
+cache_requests = Counter("cache_requests_total", "lookups of the caches", ("cache", "result"))
+
+registry = [
+    request_duration,
+    request_sql_statements,
+    request_sql_duration,
+    request_scrape_duration,
+    request_serialize_duration,
+    sql_duration,
+    slow_queries,
+    scrape_duration,
+    cache_requests,
+]
+
+def request_metrics():
+    """the counters of the current request or None outside of one"""
+    if has_request_context():
+        return g.get("request_metrics")
+
+def start_request():
+    g.request_started = time.perf_counter()
+    g.request_metrics = defaultdict(float)
+
+def finish_request(response):
+    """records the metrics of the request and adds a Server-Timing header"""
+    metrics = request_metrics()
+    if metrics is None:
+        return response
+    seconds = time.perf_counter() - g.request_started
+    # the rule and not the path so every house id is the same endpoint
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_duration.observe(seconds, endpoint, request.method, response.status_code)
+    request_sql_statements.observe(metrics["sql_statements"], endpoint)
+    request_sql_duration.observe(metrics["sql_seconds"], endpoint)
+    request_scrape_duration.observe(metrics["scrape_seconds"], endpoint)
+    request_serialize_duration.observe(metrics["serialize_seconds"], endpoint)
+    # the paths that served the scrapes of the request
+    paths = " ".join(p for p in scrape_paths if metrics[f"{p}_scrapes"])
+    scrape_desc = f';desc="{paths}"' if paths else ""
+    response.headers["Server-Timing"] = ", ".join([
+        f"sql;dur={1000 * metrics['sql_seconds']:.2f}",
+        f"scrape;dur={1000 * metrics['scrape_seconds']:.2f}{scrape_desc}",
+        f"serialize;dur={1000 * metrics['serialize_seconds']:.2f}",
+        f"total;dur={1000 * seconds:.2f}",
+    ])
+    return response
+
+@contextmanager
+def timed(name):
+    """adds the time of the block to name_seconds of the request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = request_metrics()
+        if metrics is not None:
+            metrics[f"{name}_seconds"] += time.perf_counter() - start
+
+def record_scrape(seconds, error=False, path="browser"):
+    """path is http, browser or fallback, the browser after the http backend"""
+    scrape_duration.observe(seconds, path, "error" if error else "ok")
+    metrics = request_metrics()
+    if metrics is not None:
+        metrics["scrapes"] += 1
+        metrics[f"{path}_scrapes"] += 1
+        metrics["scrape_seconds"] += seconds
+
+def record_cache(cache, hit):
+    cache_requests.inc(cache, "hit" if hit else "miss")
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    sql_duration.observe(seconds)
+    metrics = request_metrics()
+    if metrics is not None:
+        metrics["sql_statements"] += 1
+        metrics["sql_seconds"] += seconds
+    threshold = current_app.config["SLOW_QUERY_SECONDS"] if has_app_context() else None
+    if threshold is not None and seconds >= threshold and not executemany:
+        slow_queries.inc()
+        log_slow_query(cursor, statement, parameters, seconds)
+
+def log_slow_query(cursor, statement, parameters, seconds):
+    try:
+        # on the dbapi connection so the plan isn't measured again
+        plan = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        plan = "\n".join(f"  {row[-1]}" for row in plan)
+    except sqlite3.Error as error:
+        plan = f"  no plan: {error}"
+    current_app.logger.warning(
+        "slow query (%.3f s): %s %r\n%s", seconds, statement, parameters, plan
+    )
+
+def listen_sql_events(engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+page_pool_gauges = [
+    ("size", "browser_pool_pages", "pages of the browser page pool"),
+    ("in_use", "browser_pool_pages_in_use", "pages of the browser page pool leased by a scrape"),
+    ("waiting", "browser_pool_waiting", "scrapes waiting for a page of the browser page pool"),
+]
+
+def render_metrics(page_pool_stats=None):
+    """
+    the metrics of this process in the prometheus text format, with the
+    gauges of page_pool_stats when the process has a browser page pool
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    lines.append("# HELP cache_hit_ratio share of the lookups of a cache that were hits")
+    lines.append("# TYPE cache_hit_ratio gauge")
+    with cache_requests.lock:
+        caches = defaultdict(dict)
+        for (cache, result), value in cache_requests.values.items():
+            caches[cache][result] = value
+    for cache, results in sorted(caches.items()):
+        total = results.get("hit", 0) + results.get("miss", 0)
+        lines.append(f'cache_hit_ratio{{cache="{cache}"}} {results.get("hit", 0) / total}')
+    if page_pool_stats is not None:
+        for key, name, help in page_pool_gauges:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {page_pool_stats[key]}")
+    return "\n".join(lines) + "\n"
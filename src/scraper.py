@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import asyncio
+from sqlalchemy import bindparam, text
+
+from src.conf import db
+from src.demographic import Demographic, write_demographics
+from src.zipwho import details_url, parse_result_table_cells, table_values, table_parse
+
+class RateLimiter:
+    """spaces the start of the requests to at most rate per second"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = 0
+
+    async def wait(self):
+        now = time.monotonic()
+        delay = self.next_time - now
+        self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class Checkpoint:
+    """
+    the zip codes that failed, saved with every batch so a crashed
+    run resumes without retrying zip codes that keep failing
+
+    zip codes that were scraped don't need to be saved because
+    they are already in the Demographic table
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.failed = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.failed = json.load(file)["failed"]
+
+    def fail(self, zip_code, error):
+        attempts = self.failed.get(zip_code, {}).get("attempts", 0)
+        self.failed[zip_code] = {
+            "attempts": attempts + 1, "error": str(error), "failed_at": time.time(),
+        }
+
+    def gave_up(self, zip_code, max_attempts, retry_after=None, now=None):
+        """
+        whether zip_code failed max_attempts times, with retry_after
+        the attempts start over that many seconds after the last failure
+        """
+        failure = self.failed.get(zip_code, {})
+        if failure.get("attempts", 0) < max_attempts:
+            return False
+        if retry_after is None:
+            return True
+        now = time.time() if now is None else now
+        return now - failure.get("failed_at", 0) < retry_after
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"failed": self.failed}, file)
+        os.replace(temp_path, self.path)
+
+class ScrapeReport:
+
+    def __init__(self, total):
+        self.total = total
+        self.scraped = 0
+        self.empty = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    def done(self):
+        return self.scraped + self.empty + self.failed
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done() / elapsed if elapsed else 0
+        return (
+            f"{self.done()}/{self.total} zip codes, {self.scraped} scraped, "
+            f"{self.empty} without data, {self.failed} failed, "
+            f"{rate:.2f} zip codes/s"
+        )
+
+def pending_zip_codes(checkpoint, max_attempts):
+    # a single anti join instead of one lookup per zip code
+    zip_codes = db.session.execute(text(
+        "SELECT DISTINCT h.zip_code FROM house h "
+        "LEFT JOIN demographic d ON d.zip_code = h.zip_code "
+        "WHERE d.zip_code IS NULL AND h.zip_code IS NOT NULL "
+        "ORDER BY h.zip_code"
+    )).scalars().all()
+    return [zip_code for zip_code in zip_codes if not checkpoint.gave_up(zip_code, max_attempts)]
+
+def stale_zip_codes(checkpoint, max_attempts, ttl, negative_ttl, limit=None, now=None):
+    """
+    the scraped zip codes older than ttl, or negative_ttl when
+    zipwho.com had no data, the ones with more houses first, a zip
+    code that kept failing is tried again after negative_ttl
+    """
+    now = time.time() if now is None else now
+    sql = (
+        "SELECT d.zip_code FROM demographic d "
+        "JOIN (SELECT zip_code, count(*) AS houses FROM house GROUP BY zip_code) h "
+        "ON h.zip_code = d.zip_code "
+        "WHERE coalesce(d.scraped_at, 0) < CASE "
+        "WHEN d.median_income IS NULL AND d.population IS NULL THEN :negative_before "
+        "ELSE :before END "
+        "ORDER BY h.houses DESC, d.zip_code"
+    )
+    zip_codes = db.session.execute(text(sql), {
+        "before": now - ttl,
+        "negative_before": now - negative_ttl,
+    }).scalars().all()
+    zip_codes = [
+        zip_code for zip_code in zip_codes
+        if not checkpoint.gave_up(zip_code, max_attempts, retry_after=negative_ttl, now=now)
+    ]
+    return zip_codes[:limit] if limit is not None else zip_codes
+
+def insert_demographics(rows):
+    if rows:
+        write_demographics(db.session, rows)
+        db.session.commit()
+
+def refresh_demographics(rows):
+    """
+    writes the rows scraped again, a zip code that has no data now
+    keeps the values it had with the new time, so it waits a ttl
+    before it's scraped again like the others
+    """
+    # the rows of zip codes without data only have zip_code and scraped_at
+    rows_with_values = [row for row in rows if "median_income" in row]
+    write_demographics(db.session, rows_with_values, replace=True)
+    negative_rows = [row for row in rows if "median_income" not in row]
+    if negative_rows:
+        table = Demographic.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.zip_code == bindparam("key"))
+            .values(scraped_at=bindparam("time")),
+            [{"key": row["zip_code"], "time": row["scraped_at"]} for row in negative_rows],
+        )
+    db.session.commit()
+
+async def scrape_zip_codes(pool, zip_codes, checkpoint, concurrency=4, rate=None, batch_size=100,
+                           write=insert_demographics, deadline=None):
+    """
+    scraps the zip codes with concurrency pages of the pool at the
+    same time and writes the results in batches with write, no zip
+    code is started after deadline, a time.monotonic() value
+    """
+    limiter = RateLimiter(rate)
+    report = ScrapeReport(len(zip_codes))
+    pending = iter(zip_codes)
+    buffer = []
+
+    def flush():
+        write(buffer)
+        checkpoint.save()
+        buffer.clear()
+        print(report.summary())
+
+    async def worker():
+        for zip_code in pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            await limiter.wait()
+            try:
+                table_content = await pool.goto_and_select(
+                    details_url(zip_code), "div#details_table"
+                )
+                values = table_values(parse_result_table_cells(table_content))
+            except Exception as error:
+                report.failed += 1
+                checkpoint.fail(zip_code, error)
+                print(f"{zip_code} failed: {error}")
+                continue
+            if values:
+                row = table_parse(values)
+                report.scraped += 1
+            else:
+                # stored without values so it isn't scraped again
+                row = {}
+                report.empty += 1
+            checkpoint.failed.pop(zip_code, None)
+            row["zip_code"] = zip_code
+            row["scraped_at"] = time.time()
+            buffer.append(row)
+            if len(buffer) >= batch_size:
+                flush()
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    finally:
+        flush()
+    return report
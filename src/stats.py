@@ -0,0 +1,194 @@
+import json
+import math
+from collections import defaultdict
+
+from src.conf import db
+
+# relative error of the quantiles returned by the sketches
+sketch_accuracy = 0.01
+sketch_gamma = (1 + sketch_accuracy) / (1 - sketch_accuracy)
+sketch_log_gamma = math.log(sketch_gamma)
+
+percentiles = [10, 25, 50, 75, 90]
+
+# the geographies the stats are grouped by, besides status
+stats_levels = ["state_code", "city", "zip_code"]
+
+def sketch_index(value):
+    if value is None or value <= 0:
+        return None
+    return math.ceil(math.log(value) / sketch_log_gamma)
+
+class QuantileSketch:
+    """
+    counts values in buckets that grow by sketch_gamma, so any
+    quantile is within sketch_accuracy of the real value, two
+    sketches merge by adding their buckets and a quantile only
+    walks the buckets instead of sorting the values
+    """
+
+    def __init__(self, zeros=0, bins=None):
+        # zero and negative values
+        self.zeros = zeros
+        self.bins = bins or defaultdict(int)
+
+    def add_index(self, index):
+        if index is None:
+            self.zeros += 1
+        else:
+            self.bins[index] += 1
+
+    def add(self, value):
+        self.add_index(sketch_index(value))
+
+    def merge(self, other):
+        self.zeros += other.zeros
+        for index, count in other.bins.items():
+            self.bins[index] += count
+
+    def count(self):
+        return self.zeros + sum(self.bins.values())
+
+    def quantile(self, q):
+        count = self.count()
+        if not count:
+            return None
+        rank = q * (count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * sketch_gamma ** index / (sketch_gamma + 1)
+        return 2 * sketch_gamma ** max(self.bins) / (sketch_gamma + 1)
+
+    def dumps(self):
+        return json.dumps({"zeros": self.zeros, "bins": self.bins})
+
+    @classmethod
+    def loads(cls, data):
+        data = json.loads(data)
+        bins = defaultdict(int, {int(i): c for i, c in data["bins"].items()})
+        return cls(data["zeros"], bins)
+
+class MarketStats(db.Model):
+    __tablename__ = "market_stats"
+
+    status = db.Column(db.String(30), primary_key=True)
+    level = db.Column(db.String(20), primary_key=True)
+    state_code = db.Column(db.String(10), primary_key=True)
+    key = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer)
+    price_sketch = db.Column(db.Text)
+    price_per_sq_ft_sketch = db.Column(db.Text)
+    # percentiles of the sketches so a query only reads columns
+    price_p10 = db.Column(db.Float)
+    price_p25 = db.Column(db.Float)
+    price_p50 = db.Column(db.Float)
+    price_p75 = db.Column(db.Float)
+    price_p90 = db.Column(db.Float)
+    price_per_sq_ft_p10 = db.Column(db.Float)
+    price_per_sq_ft_p25 = db.Column(db.Float)
+    price_per_sq_ft_p50 = db.Column(db.Float)
+    price_per_sq_ft_p75 = db.Column(db.Float)
+    price_per_sq_ft_p90 = db.Column(db.Float)
+
+def market_stats_to_dict(stats):
+    return {
+        "status": stats.status,
+        "state_code": stats.state_code,
+        stats.level: stats.key,
+        "count": stats.count,
+        "median_price": stats.price_p50,
+        "price_percentiles": {
+            f"p{p}": getattr(stats, f"price_p{p}") for p in percentiles
+        },
+        "price_per_sq_ft_percentiles": {
+            f"p{p}": getattr(stats, f"price_per_sq_ft_p{p}") for p in percentiles
+        },
+    }
+
+def group_sketches(rows, groups=None):
+    """
+    adds rows of (status, city, zip_code, state_code, price,
+    price_per_sq_ft) to the sketches of their groups
+    """
+    if groups is None:
+        groups = defaultdict(lambda: (QuantileSketch(), QuantileSketch()))
+    for status, city, zip_code, state_code, price, price_per_sq_ft in rows:
+        status = status or ""
+        state_code = state_code or ""
+        # the bucket is computed once for the three groups of the row
+        price_index = sketch_index(price)
+        price_per_sq_ft_index = sketch_index(price_per_sq_ft)
+        for level, key in (("state_code", state_code), ("city", city), ("zip_code", zip_code)):
+            price_sketch, price_per_sq_ft_sketch = groups[(status, level, state_code, key or "")]
+            price_sketch.add_index(price_index)
+            # price_per_sq_ft is 0 without house_size, it isn't a value
+            if price_per_sq_ft_index is not None:
+                price_per_sq_ft_sketch.add_index(price_per_sq_ft_index)
+    return groups
+
+def write_groups(cursor, groups):
+    columns = [
+        "status", "level", "state_code", "key", "count",
+        "price_sketch", "price_per_sq_ft_sketch",
+    ] + [f"price_p{p}" for p in percentiles] + [f"price_per_sq_ft_p{p}" for p in percentiles]
+    rows = []
+    for (status, level, state_code, key), (price, price_per_sq_ft) in groups.items():
+        rows.append(
+            [status, level, state_code, key, price.count(), price.dumps(), price_per_sq_ft.dumps()]
+            + [price.quantile(p / 100) for p in percentiles]
+            + [price_per_sq_ft.quantile(p / 100) for p in percentiles]
+        )
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO market_stats ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})",
+        rows,
+    )
+
+house_stats_columns = "status, city, zip_code, state_code, price, price_per_sq_ft"
+
+def build_market_stats(conn, batch_size=100000):
+    """rebuilds the summary tables with one pass over the houses"""
+    cursor = conn.cursor()
+    groups = None
+    rows = conn.execute(f"SELECT {house_stats_columns} FROM house")
+    for batch in iter(lambda: rows.fetchmany(batch_size), []):
+        groups = group_sketches(batch, groups)
+    cursor.execute("DELETE FROM market_stats")
+    if groups:
+        write_groups(cursor, groups)
+    conn.commit()
+
+def update_market_stats(conn, rows):
+    """merges new houses into the summary tables"""
+    groups = group_sketches(rows)
+    cursor = conn.cursor()
+    for (status, level, state_code, key), (price, price_per_sq_ft) in groups.items():
+        stored = cursor.execute(
+            "SELECT price_sketch, price_per_sq_ft_sketch FROM market_stats "
+            "WHERE status = ? AND level = ? AND state_code = ? AND key = ?",
+            (status, level, state_code, key),
+        ).fetchone()
+        if stored:
+            price.merge(QuantileSketch.loads(stored[0]))
+            price_per_sq_ft.merge(QuantileSketch.loads(stored[1]))
+    write_groups(cursor, groups)
+    conn.commit()
+
+def get_market_stats(args):
+    level = args.get("group_by", "state_code")
+    query = MarketStats.query.filter(MarketStats.level == level)
+    status = args.get("status")
+    if status:
+        query = query.filter(MarketStats.status == status)
+    state_code = args.get("state_code")
+    if state_code:
+        query = query.filter(MarketStats.state_code == state_code)
+    key = args.get(level)
+    if key and level != "state_code":
+        query = query.filter(MarketStats.key == key)
+    limit = min(max(args.get("limit", 1000, type=int), 1), 10000)
+    return query.order_by(MarketStats.status, MarketStats.state_code, MarketStats.key).limit(limit).all()
@@ -0,0 +1,57 @@
+import json
+import time
+from flask import current_app
+from sqlalchemy import func, select
+
+from src.conf import db, write_session
+from src.metrics import record_cache
+from src.zipwho import ranges_to_filters
+
+class ZipSearch(db.Model):
+    """the zip codes zipwho.com returned for a demographic search"""
+    __tablename__ = "zip_search_cache"
+
+    key = db.Column(db.String(1000), primary_key=True)
+    zips = db.Column(db.Text)
+    created_at = db.Column(db.Float, index=True)
+
+# counters of this process, the entries are shared by all workers
+zip_search_cache_stats = {"hits": 0, "misses": 0}
+
+def zip_search_key(state_code, ranges):
+    # only the state and the demographic filters change the result
+    return f"{state_code}:{ranges_to_filters(ranges)}"
+
+def cached_zip_search(state_code, ranges, search):
+    """
+    the zips of search(state_code, ranges) from the cache table,
+    entries expire after ZIP_SEARCH_CACHE_TTL seconds and the oldest
+    ones are removed when there are more than ZIP_SEARCH_CACHE_SIZE
+    """
+    key = zip_search_key(state_code, ranges)
+    now = time.time()
+    entry = db.session.get(ZipSearch, key)
+    if entry is not None and now - entry.created_at < current_app.config["ZIP_SEARCH_CACHE_TTL"]:
+        zip_search_cache_stats["hits"] += 1
+        record_cache("zip_search", True)
+        return json.loads(entry.zips)
+
+    zip_search_cache_stats["misses"] += 1
+    record_cache("zip_search", False)
+    zips = search(state_code, ranges)
+    with write_session() as session:
+        session.merge(ZipSearch(key=key, zips=json.dumps(zips), created_at=now))
+        session.commit()
+        evict_zip_searches(session, current_app.config["ZIP_SEARCH_CACHE_SIZE"])
+    return zips
+
+def evict_zip_searches(session, size):
+    count = session.execute(select(func.count()).select_from(ZipSearch)).scalar()
+    if count > size:
+        oldest = select(ZipSearch.key).order_by(ZipSearch.created_at).limit(count - size)
+        session.execute(ZipSearch.__table__.delete().where(ZipSearch.key.in_(oldest)))
+        session.commit()
+
+def get_zip_search_cache_stats():
+    entries = db.session.execute(select(func.count()).select_from(ZipSearch)).scalar()
+    return {**zip_search_cache_stats, "entries": entries}
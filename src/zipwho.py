@@ -1,4 +1,3 @@
-from functools import lru_cache
 from lxml import html
 from urllib.parse import urlencode
 
@@ -31,32 +30,46 @@ table_attributes = [
     label.lower().replace(" ", "_") for label in table_labels
 ]
 
-def build_filters_argument(args):
+def demographic_ranges(args):
     """
-    filters is an argument that is build joining different attributes for example
-    # filters=MedianIncome-7236-200001_CostOfLivingIndex-14.3-1103.7
+    the min_* and max_* demographic filters as a list of
+    (attribute, min, max) floats, a missing bound is None
     """
-    filters = []
+    ranges = []
     for attr in table_attributes:
-        attr_min = args.get(f"min_{attr}", "")
-        attr_max = args.get(f"max_{attr}", "")
-        if attr_min or attr_max:
-            name = "".join([p.capitalize() for p in attr.split("_")])
-            filters.append(f"{name}-{attr_min}-{attr_max}")
-    return "_".join(filters)
+        attr_min = to_float(str(args.get(f"min_{attr}", "")))
+        attr_max = to_float(str(args.get(f"max_{attr}", "")))
+        if attr_min is not None or attr_max is not None:
+            ranges.append((attr, attr_min, attr_max))
+    return ranges
 
-@lru_cache
-def get_zips_by_demographics(args):
-    zips = []
-    state = args.get("state_code")
-    filters = build_filters_argument(args)
+def format_bound(value):
+    if value is None:
+        return ""
+    return str(int(value)) if value.is_integer() else str(value)
+
+def ranges_to_filters(ranges):
+    """
+    the filters argument of zipwho.com for demographic_ranges, the
+    same filters always give the same string whatever their format
+    # filters=MedianIncome-7236-200001_CostOfLivingIndex-14.3-1103.7
+    """
+    return "_".join(
+        "".join([p.capitalize() for p in attr.split("_")])
+        + f"-{format_bound(attr_min)}-{format_bound(attr_max)}"
+        for attr, attr_min, attr_max in ranges
+    )
+
+def search_url(state_code, ranges):
     url_arguments = urlencode({
-        "filters": filters,
-        "state": state,
+        "filters": ranges_to_filters(ranges),
+        "state": state_code,
         "mode": "demo",
     })
-    full_url = f"https://zipwho.com/?{url_arguments}"
-    table_content = goto_and_select(full_url, "div#search_results_table")
+    return f"https://zipwho.com/?{url_arguments}"
+
+def parse_search_results(table_content):
+    zips = []
     tree = html.fromstring(table_content)
     table_rows = tree.xpath("//tr")
     for row in table_rows:
@@ -68,17 +81,26 @@ def get_zips_by_demographics(args):
                 zips.append(link[0])
     return zips
 
-def get_result_table_cells(zip_code, page=None):
+def scrape_zips_by_demographics(state_code, ranges):
+    table_content = goto_and_select(search_url(state_code, ranges), "div#search_results_table")
+    return parse_search_results(table_content)
+
+def details_url(zip_code):
     url_arguments = urlencode({
         "zip": zip_code,
         "mode": "zip",
     })
-    full_url = f"https://zipwho.com/?{url_arguments}"
-    table_content = goto_and_select(full_url, "div#details_table", page=page)
+    return f"https://zipwho.com/?{url_arguments}"
+
+def parse_result_table_cells(table_content):
     tree = html.fromstring(table_content)
     table_cells = tree.xpath("//td/text()")
     return table_cells
 
+def get_result_table_cells(zip_code, page=None):
+    table_content = goto_and_select(details_url(zip_code), "div#details_table", page=page)
+    return parse_result_table_cells(table_content)
+
 def table_values(table_cells):
     # there are 17 attributes (rows in the table)
     # and there are 3 columns for each
@@ -1,5 +1,11 @@
-from src.house import house_attrs
+import json
+import pytest
+
+from src.conf import db
+from src.house import House, encode_cursor, house_attrs
+from src.house_engine import build_house_columns
 from src.demographic import demographic_attrs
+from src.http_cache import bump_generation
 
 zips = ["111", "222", "333", "444"]
 
@@ -54,14 +60,14 @@ def test_api_get_house_by_property(client, mocker):
         'total': 2,
         'results': [
             fill_with_none({
-                'id': 'hash2',
+                'id': '2' * 64,
                 'bed': 2,
                 'price': 200000.0,
                 'status': 'for_sale',
                 'zip_code': '222',
             }, house_attrs),
             fill_with_none({
-                'id': 'hash3',
+                'id': '3' * 64,
                 'bed': 3,
                 'price': 300000.0,
                 'status': 'for_sale',
@@ -73,11 +79,11 @@ def test_api_get_house_by_property(client, mocker):
 def test_api_get_property_by_id(client, mocker):
     goto_and_select = mocker.patch("src.zipwho.goto_and_select")
     goto_and_select.return_value = ""
-    response = client.get("/properties/hash1")
+    response = client.get("/properties/" + "1" * 64)
     assert response.status_code == 200
     assert response.json == fill_with_none({
         'bed': 1,
-        'id': 'hash1',
+        'id': '1' * 64,
         'price': 100000.0,
         'status': 'for_sale',
         'zip_code': '111',
@@ -97,4 +103,105 @@ def test_api_get_demographic(client, mocker):
             'median_income': 111.0,
             'zip_code': '111'
         }, demographic_attrs),
-    }
\ No newline at end of file
+    }
+
+def test_command_explain_query(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["explain-query", "status=for_sale&zip_code=111"])
+    assert result.exit_code == 0
+    assert "ix_house_status_zip_code" in result.output
+
+    result = runner.invoke(args=["explain-query", "status=for_sale&sort=bed&page=2"])
+    assert "USE TEMP B-TREE FOR ORDER BY" in result.output
+    assert "LIMIT 20 OFFSET 20" in result.output
+
+def test_api_get_house_by_property_cursor(client):
+    params = {"status": "for_sale", "per_page": 2, "cursor": "", "total": "none"}
+    response = client.get("/properties", query_string=params)
+    assert response.status_code == 200
+    assert response.json["total"] is None
+    assert [h["id"] for h in response.json["results"]] == ["1" * 64, "2" * 64]
+
+    params["cursor"] = response.json["next_cursor"]
+    response = client.get("/properties", query_string=params)
+    assert [h["id"] for h in response.json["results"]] == ["3" * 64]
+    assert response.json["next_cursor"] is None
+
+@pytest.mark.parametrize("engine", ["sql", "columnar"])
+@pytest.mark.parametrize("sort, cursor", [
+    (None, "not base64!"),
+    (None, encode_cursor({"id": "1" * 64})),
+    (None, encode_cursor([1])),
+    (None, encode_cursor(["x"])),
+    (None, encode_cursor([None])),
+    (None, encode_cursor([100000.0, "1" * 64])),
+    ("price", encode_cursor(["1" * 64])),
+    ("price", encode_cursor(["x", "1" * 64])),
+    ("price", encode_cursor([True, "1" * 64])),
+    ("price", encode_cursor([100000.0, None])),
+    ("bed", encode_cursor([[1], "1" * 64])),
+])
+def test_api_get_house_by_property_invalid_cursor(client, tmp_path, monkeypatch, engine, sort, cursor):
+    if engine == "columnar":
+        build_house_columns(db.session.connection().connection.driver_connection, str(tmp_path / "house_columns"))
+        monkeypatch.setitem(client.application.config, "HOUSE_COLUMNS_PATH", str(tmp_path / "house_columns"))
+    monkeypatch.setitem(client.application.config, "HOUSE_ENGINE", engine)
+    params = {"status": "for_sale", "cursor": cursor}
+    if sort:
+        params["sort"] = sort
+    response = client.get("/properties", query_string=params)
+    assert response.status_code == 400
+    assert response.json == {"error": "The 'cursor' argument is invalid."}
+
+def test_api_get_house_by_property_total_estimate(client):
+    params = {"status": "for_sale", "total": "estimate"}
+    response = client.get("/properties", query_string=params)
+    assert response.status_code == 200
+    assert response.json["total"] == 3
+    assert response.json["pages"] == 1
+
+    # the cached count until an import bumps the generation
+    db.session.add(House(id="4" * 64, status="for_sale", price=400000.0, bed=4, zip_code=444))
+    db.session.commit()
+    assert client.get("/properties", query_string=params).json["total"] == 3
+    bump_generation()
+    assert client.get("/properties", query_string=params).json["total"] == 4
+
+def test_api_get_property_by_id_not_found(client):
+    assert client.get("/properties/" + "4" * 64).status_code == 404
+    assert client.get("/properties/not-a-hex-id").status_code == 404
+
+def test_api_export_house_by_property(client):
+    params = {"status": "for_sale", "min_price": "200000"}
+    response = client.get("/properties/export", query_string=params)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["2" * 64, "3" * 64]
+
+    params["format"] = "csv"
+    response = client.get("/properties/export", query_string=params)
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == ",".join(house_attrs)
+    assert len(lines) == 3
+
+def test_api_get_properties_batch(client):
+    house_ids = ["3" * 64, "4" * 64, "1" * 64, "not-hex"]
+    response = client.post("/properties/batch", json={"ids": house_ids})
+    assert response.status_code == 200
+    assert [h["id"] for h in response.json["results"]] == ["3" * 64, "1" * 64]
+    assert response.json["results"][1]["zip_info"]["median_income"] == 111.0
+    # 333 doesn't have demographics and it is not scraped
+    assert "zip_info" not in response.json["results"][0]
+    assert response.json["missing"] == ["4" * 64, "not-hex"]
+
+    assert client.post("/properties/batch", json={"ids": "1"}).status_code == 400
+    for body in [[], "x", 1, None]:
+        assert client.post("/properties/batch", json=body).status_code == 400
+        assert client.post("/demographics/batch", json=body).status_code == 400
+
+def test_api_get_demographics_batch(client):
+    response = client.post("/demographics/batch", json={"zip_codes": ["222", "333", "111"]})
+    assert response.status_code == 200
+    assert [d["zip_code"] for d in response.json["results"]] == ["222", "111"]
+    assert response.json["missing"] == ["333"]
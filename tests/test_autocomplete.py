@@ -0,0 +1,65 @@
+from src.conf import db
+from src.house import House
+from src.autocomplete import build_house_names, update_house_names
+
+def add_houses(app):
+    db.session.add_all([
+        House(id="4" * 64, status="for_sale", price=1.0, city="San Francisco", state="California", street="1 Main St"),
+        House(id="5" * 64, status="for_sale", price=1.0, city="South San Francisco", state="California"),
+        House(id="6" * 64, status="for_sale", price=1.0, city="San Francisco", state="California"),
+        House(id="7" * 64, status="sold", price=1.0, city="Santa Fe", state="New Mexico"),
+    ])
+    db.session.commit()
+    conn = db.session.connection().connection.driver_connection
+    build_house_names(conn)
+    return conn
+
+def test_autocomplete(app, client):
+    add_houses(app)
+    response = client.get("/autocomplete?field=city&prefix=san")
+    assert response.json["results"] == [
+        {"value": "San Francisco", "count": 2},
+        {"value": "Santa Fe", "count": 1},
+        {"value": "South San Francisco", "count": 1},
+    ]
+    response = client.get("/autocomplete?field=city&prefix=san fr")
+    assert [r["value"] for r in response.json["results"]] == ["San Francisco", "South San Francisco"]
+    response = client.get("/autocomplete?field=state&prefix=new")
+    assert response.json["results"] == [{"value": "New Mexico", "count": 1}]
+    assert client.get('/autocomplete?field=city&prefix="').json["results"] == []
+    assert client.get("/autocomplete?field=zip_code&prefix=1").status_code == 400
+
+def test_update_house_names(app, client):
+    conn = add_houses(app)
+    update_house_names(conn, [("Santa Fe", "New Mexico", None), ("Sandy", "Utah", "")])
+    response = client.get("/autocomplete?field=city&prefix=sa&limit=2")
+    assert response.json["results"] == [
+        {"value": "San Francisco", "count": 2},
+        {"value": "Santa Fe", "count": 2},
+    ]
+    assert client.get("/autocomplete?field=city&prefix=sandy").json["results"] == [
+        {"value": "Sandy", "count": 1},
+    ]
+
+def test_city_prefix_filter(app, client):
+    add_houses(app)
+    response = client.get("/properties?status=for_sale&city_prefix=san fr")
+    assert sorted(h["id"][0] for h in response.json["results"]) == ["4", "5", "6"]
+    response = client.get("/properties?status=for_sale&city_prefix=santa")
+    assert response.json["results"] == []
+
+def test_city_prefix_filter_many_cities(app, client):
+    # more matching cities than sqlite allows variables in a statement
+    conn = db.session.connection().connection.driver_connection
+    conn.executemany(
+        "INSERT INTO house (id, status, price, city) VALUES (?, 'for_sale', 1.0, ?)",
+        [(i.to_bytes(32, "big"), f"Sandy {i}") for i in range(40000)],
+    )
+    build_house_names(conn)
+    response = client.get("/properties?status=for_sale&city_prefix=sand&per_page=1")
+    assert response.status_code == 200
+    assert response.json["total"] == 40000
+    # the names of the other fields are in their own index
+    update_house_names(conn, [("Utah", "Sandy", "Sandy Rd")])
+    assert client.get("/autocomplete?field=city&prefix=utah").json["results"] == [{"value": "Utah", "count": 1}]
+    assert client.get("/autocomplete?field=state&prefix=sandy").json["results"] == [{"value": "Sandy", "count": 1}]
@@ -0,0 +1,32 @@
+from benchmarks.generator import columns, generate_csv
+from benchmarks.run import compare_results, metric
+from src.importer import parse_line
+
+def test_generate_csv(tmp_path):
+    generate_csv(tmp_path / "a.csv", 1000, seed=1)
+    generate_csv(tmp_path / "b.csv", 1000, seed=1)
+    generate_csv(tmp_path / "c.csv", 1000, seed=2)
+    lines = (tmp_path / "a.csv").read_text().splitlines()
+    assert (tmp_path / "a.csv").read_bytes() == (tmp_path / "b.csv").read_bytes()
+    assert (tmp_path / "a.csv").read_bytes() != (tmp_path / "c.csv").read_bytes()
+
+    assert lines[0] == ",".join(columns)
+    assert len(lines) == 1001
+    rows = [parse_line(line) for line in lines[1:]]
+    assert sum(row is not None for row in rows) > 990
+    assert {row[1] for row in rows if row} == {"for_sale", "sold", "ready_to_build"}
+
+def test_compare_results():
+    base = {"metrics": {
+        "latency": metric(10.0, "ms", "lower"),
+        "throughput": metric(100.0, "rows/s", "higher"),
+        "removed": metric(1.0, "ms", "lower"),
+    }}
+    new = {"metrics": {
+        "latency": metric(10.5, "ms", "lower"),
+        "throughput": metric(80.0, "rows/s", "higher"),
+    }}
+    assert compare_results(base, new, 0.1) == [("throughput", 100.0, 80.0, -0.2)]
+    assert compare_results(base, new, 0.01) == [
+        ("latency", 10.0, 10.5, 0.05), ("throughput", 100.0, 80.0, -0.2),
+    ]
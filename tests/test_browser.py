@@ -0,0 +1,165 @@
+import os
+import asyncio
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import browser
+from src.browser import HttpFetcher, HttpPool, PagePool, goto_and_select
+from src.metrics import scrape_duration
+from src.zipwho import parse_result_table_cells, parse_search_results, table_values
+
+fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+class FakePage:
+
+    def __init__(self):
+        self.closed = False
+        self.visited = []
+
+    async def route(self, pattern, handler):
+        pass
+
+    async def goto(self, url):
+        if url == "crash":
+            raise RuntimeError("page crashed")
+        self.visited.append(url)
+
+    async def wait_for_selector(self, selector, timeout):
+        pass
+
+    async def inner_html(self, selector):
+        return f"<table>{self.visited[-1]}</table>"
+
+    async def close(self):
+        self.closed = True
+
+    def is_closed(self):
+        return self.closed
+
+class FakeBrowser:
+
+    def __init__(self):
+        self.pages = []
+
+    async def new_page(self):
+        self.pages.append(FakePage())
+        return self.pages[-1]
+
+    def is_connected(self):
+        return True
+
+    async def close(self):
+        pass
+
+def fake_launcher(browsers):
+    async def launch():
+        browsers.append(FakeBrowser())
+        return None, browsers[-1]
+    return launch
+
+def test_page_pool_recycles_pages():
+    browsers = []
+    pool = PagePool(size=1, max_uses=2, launch=fake_launcher(browsers))
+
+    async def scrape():
+        results = [await pool.goto_and_select(url, "table") for url in "abc"]
+        with pytest.raises(RuntimeError):
+            await pool.goto_and_select("crash", "table")
+        results.append(await pool.goto_and_select("d", "table"))
+        return results
+
+    assert asyncio.run(scrape()) == [
+        "<table>a</table>", "<table>b</table>", "<table>c</table>", "<table>d</table>",
+    ]
+    # the browser is launched once and a page is replaced
+    # after two uses and after the crash
+    assert len(browsers) == 1
+    assert [p.visited for p in browsers[0].pages] == [["a", "b"], ["c"], ["d"]]
+    assert all(p.closed for p in browsers[0].pages[:2])
+    assert pool.stats() == {"size": 1, "in_use": 0, "waiting": 0}
+
+def test_page_pool_is_bounded():
+    browsers = []
+    pool = PagePool(size=2, launch=fake_launcher(browsers))
+
+    async def scrape():
+        return await asyncio.gather(*[
+            pool.goto_and_select(str(i), "table") for i in range(10)
+        ])
+
+    assert len(asyncio.run(scrape())) == 10
+    assert len(browsers[0].pages) == 2
+
+class QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def zipwho_url():
+    """the saved zipwho.com pages served locally"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=fixtures_path))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_http_fetcher(zipwho_url):
+    fetcher = HttpFetcher()
+    content = fetcher.fetch(f"{zipwho_url}/zipwho_details.html?zip=75001&mode=zip", "div#details_table")
+    values = table_values(parse_result_table_cells(content))
+    assert values[0] == 63812.0 and values[7] == 50716.0 and len(values) == 17
+
+    content = fetcher.fetch(f"{zipwho_url}/zipwho_search.html?state=TX&mode=demo", "div#search_results_table")
+    assert parse_search_results(content) == ["75001", "75002", "75006"]
+
+    # the table is rendered by javascript
+    assert fetcher.fetch(f"{zipwho_url}/zipwho_script.html", "div#details_table") is None
+    fetcher.close()
+
+class FakeThreadedPool:
+
+    def __init__(self):
+        self.urls = []
+
+    def goto_and_select(self, full_url, selector):
+        self.urls.append(full_url)
+        return "<table>rendered</table>"
+
+def test_goto_and_select_backends(zipwho_url, mocker, monkeypatch):
+    page_pool = FakeThreadedPool()
+    mocker.patch("src.browser.get_page_pool", return_value=page_pool)
+    monkeypatch.setattr(browser, "http_fetcher", HttpFetcher())
+    scrape_duration.values.clear()
+
+    content = goto_and_select(f"{zipwho_url}/zipwho_details.html", "div#details_table", backend="http")
+    assert "Median Income" in content
+    assert page_pool.urls == []
+
+    url = f"{zipwho_url}/zipwho_script.html"
+    assert goto_and_select(url, "div#details_table", backend="http") == "<table>rendered</table>"
+    assert goto_and_select(url, "div#details_table", backend="browser") == "<table>rendered</table>"
+    assert page_pool.urls == [url, url]
+    assert {key: values[-1] for key, values in scrape_duration.values.items()} == {
+        ("http", "ok"): 1, ("fallback", "ok"): 1, ("browser", "ok"): 1,
+    }
+
+def test_http_pool(zipwho_url):
+    browsers = []
+    pool = HttpPool(PagePool(size=1, launch=fake_launcher(browsers)))
+
+    async def scrape():
+        return [
+            await pool.goto_and_select(f"{zipwho_url}/{name}", "div#details_table")
+            for name in ["zipwho_details.html", "zipwho_script.html"]
+        ]
+
+    details, rendered = asyncio.run(scrape())
+    assert "Median Income" in details
+    assert rendered == f"<table>{zipwho_url}/zipwho_script.html</table>"
+    # the browser is only launched for the page without the table
+    assert len(browsers) == 1 and len(browsers[0].pages) == 1
+    assert pool.paths == {"http": 1, "fallback": 1}
@@ -0,0 +1,43 @@
+import os
+import sqlite3
+
+import pytest
+
+from src import conf
+from sqlalchemy import inspect, text
+
+from src.conf import create_tables, db, set_read_pragmas
+
+def test_set_read_pragmas(tmp_path):
+    conn = sqlite3.connect(tmp_path / "database.db")
+    conn.execute("CREATE TABLE house (id TEXT)")
+    set_read_pragmas(conn)
+    assert conn.execute("PRAGMA query_only;").fetchone() == (1,)
+    assert conn.execute("PRAGMA temp_store;").fetchone() == (2,)
+    assert conn.execute("SELECT count(*) FROM house").fetchone() == (0,)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO house VALUES ('1')")
+
+def test_follow_database_swap(tmp_path, monkeypatch):
+    os.symlink("database.1.db", tmp_path / "database.db")
+    monkeypatch.setattr(conf, "db_path", str(tmp_path / "database.db"))
+    monkeypatch.setattr(conf, "database_realpath", str(tmp_path / "database.1.db"))
+    assert not conf.follow_database_swap()
+
+    os.remove(tmp_path / "database.db")
+    os.symlink("database.2.db", tmp_path / "database.db")
+    with conf.app.app_context():
+        assert conf.follow_database_swap()
+    assert conf.database_realpath == str(tmp_path / "database.2.db")
+
+def test_create_tables_adds_columns(app):
+    # a demographic table from before scraped_at
+    db.session.execute(text("DROP TABLE demographic"))
+    db.session.execute(text("CREATE TABLE demographic (zip_code VARCHAR(10) PRIMARY KEY, median_income FLOAT)"))
+    db.session.execute(text("INSERT INTO demographic VALUES ('111', 1.0)"))
+    db.session.commit()
+    create_tables()
+    columns = {column["name"] for column in inspect(db.engine).get_columns("demographic")}
+    assert {"population", "scraped_at", "revision"} <= columns
+    assert "ix_demographic_revision" in {index["name"] for index in inspect(db.engine).get_indexes("demographic")}
+    assert db.session.execute(text("SELECT median_income FROM demographic")).scalar() == 1.0
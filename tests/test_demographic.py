@@ -1,4 +1,7 @@
-from src.demographic import get_demographic
+import time
+
+from src.conf import db
+from src.demographic import Demographic, get_demographic
 
 def test_get_demographics_1(app):
     demographic = get_demographic(111)
@@ -63,4 +66,22 @@ def test_get_demographics_2(app, mocker):
         'asian': 47.0,
         'hispanic_ethnicity': 50.0,
         'zip_code': 555
-    }
\ No newline at end of file
+    }
+
+def test_get_demographic_negative_ttl(app, mocker):
+    goto_and_select = mocker.patch("src.zipwho.goto_and_select")
+    goto_and_select.return_value = "<table></table>"
+    ttl = app.config["DEMOGRAPHIC_NEGATIVE_TTL"]
+    db.session.add_all([
+        Demographic(zip_code="444", scraped_at=time.time()),
+        Demographic(zip_code="555", scraped_at=time.time() - ttl - 1),
+    ])
+    db.session.commit()
+
+    assert get_demographic("444") is None
+    goto_and_select.assert_not_called()
+
+    # zipwho.com has the data now
+    goto_and_select.return_value = table_content
+    assert get_demographic("555")["median_income"] == 2.0
+    assert db.session.get(Demographic, "555").scraped_at > time.time() - 60
@@ -0,0 +1,64 @@
+import time
+from sqlalchemy import select
+
+from src.conf import db
+from src.house import House
+from src.demographic import Demographic
+from src import demographic_engine
+from src.demographic_engine import get_zips_by_demographics, reset_demographic_engine
+from src.scraper import insert_demographics, refresh_demographics
+
+def add_state(state_code, demographics):
+    for i, (zip_code, median_income) in enumerate(demographics):
+        db.session.add(House(
+            id=f"{state_code}{i}".encode().hex(), status="for_sale", zip_code=zip_code, state_code=state_code,
+        ))
+        if median_income is not None:
+            db.session.add(Demographic(zip_code=zip_code, median_income=median_income))
+    db.session.commit()
+    reset_demographic_engine()
+
+def test_get_zips_by_demographics_local(app, mocker):
+    goto_and_select = mocker.patch("src.zipwho.goto_and_select")
+    add_state("WY", [("82001", 30000), ("82002", 50000), ("82003", 70000)])
+    args = {"state_code": "WY", "min_median_income": "40000", "max_median_income": "80000"}
+    assert get_zips_by_demographics(args) == ["82002", "82003"]
+    assert get_zips_by_demographics({"state_code": "WY"}) == ["82001", "82002", "82003"]
+    goto_and_select.assert_not_called()
+
+def test_get_zips_by_demographics_fallback(app, mocker):
+    scrape = mocker.patch("src.demographic_engine.scrape_zips_by_demographics")
+    scrape.return_value = ["83001"]
+    # one of the two zip codes was never scraped
+    add_state("ID", [("83001", 30000), ("83002", None)])
+    assert get_zips_by_demographics({"state_code": "ID"}) == ["83001"]
+    scrape.assert_called_once()
+
+def test_get_zips_by_demographics_after_refresh(app):
+    add_state("WY", [("82001", 30000), ("82002", 50000)])
+    args = {"state_code": "WY", "min_median_income": "40000"}
+    assert get_zips_by_demographics(args) == ["82002"]
+
+    # the rows are written in place so the count doesn't change
+    refresh_demographics([{"zip_code": "82001", "median_income": 45000.0, "scraped_at": time.time()}])
+    assert get_zips_by_demographics(args) == ["82001", "82002"]
+    insert_demographics([{"zip_code": "82003", "scraped_at": time.time()}])
+    refresh_demographics([{"zip_code": "82002", "median_income": 35000.0, "scraped_at": time.time()}])
+    assert get_zips_by_demographics(args) == ["82001"]
+    revisions = dict(db.session.execute(select(Demographic.zip_code, Demographic.revision)).all())
+    assert [revisions[zip_code] for zip_code in ["82001", "82003", "82002"]] == [1, 2, 3]
+
+def test_demographic_engine_update(app, mocker):
+    scrape = mocker.patch("src.demographic_engine.scrape_zips_by_demographics")
+    scrape.return_value = []
+    add_state("ID", [("83001", 30000), ("83002", None), ("83003", None)])
+    get_zips_by_demographics({"state_code": "ID"})
+    load = mocker.spy(demographic_engine, "load_demographic_engine")
+
+    # the zip codes scraped one at a time are added without reading the houses again
+    insert_demographics([{"zip_code": "83002", "median_income": 50000.0, "scraped_at": time.time()}])
+    insert_demographics([{"zip_code": "83003", "scraped_at": time.time()}])
+    assert get_zips_by_demographics({"state_code": "ID"}) == ["83001", "83002"]
+    assert get_zips_by_demographics({"state_code": "ID", "min_median_income": "40000"}) == ["83002"]
+    scrape.assert_called_once()
+    load.assert_not_called()
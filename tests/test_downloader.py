@@ -0,0 +1,155 @@
+import re
+import json
+import hashlib
+import time
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.downloader import Download, DownloadError
+from src.importer import header_end, split_ranges
+
+header = b"brokered_by,status,price,bed,bath,acre_lot,street,city,state,zip_code,house_size,prev_sold_date\n"
+data = header + b"".join(
+    b"1.0,for_sale,%d.0,3,2,0.5,street %d,City,Texas,75001,500.0,2020-01-01\n" % (1000 + i, i)
+    for i in range(2000)
+)
+
+class Handler(BaseHTTPRequestHandler):
+    ranges = True
+    # seconds between the chunks of a response without ranges
+    delay = 0
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_data(self, body):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"%s"' % hashlib.md5(data).hexdigest())
+        self.end_headers()
+        if body:
+            for i in range(0, len(data), 16 * 1024):
+                self.wfile.write(data[i:i + 16 * 1024])
+                time.sleep(self.delay)
+
+    def do_HEAD(self):
+        self.send_data(False)
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range") or "")
+        if_range = self.headers.get("If-Range")
+        changed = if_range is not None and if_range != '"%s"' % hashlib.md5(data).hexdigest()
+        if not self.ranges or match is None or changed:
+            return self.send_data(True)
+        start, end = int(match[1]), int(match[2])
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start:end + 1])
+
+@pytest.fixture
+def server():
+    Handler.ranges = True
+    Handler.delay = 0
+    Handler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/realtor-data.csv"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_download(server, tmp_path):
+    path = tmp_path / "realtor-data.csv"
+    Download(server, str(path), connections=4, block_size=10000).download()
+    assert path.read_bytes() == data
+    assert len(Handler.requests) == -(-len(data) // 10000)
+    assert not (tmp_path / "realtor-data.csv.part").exists()
+    assert not (tmp_path / "realtor-data.csv.download.json").exists()
+
+def test_download_without_ranges(server, tmp_path):
+    Handler.ranges = False
+    path = tmp_path / "realtor-data.csv"
+    Download(server, str(path), block_size=10000).download()
+    assert path.read_bytes() == data
+    assert Handler.requests == [None]
+
+def test_download_resume(server, tmp_path):
+    path = tmp_path / "realtor-data.csv"
+    download = Download(server, str(path), block_size=10000)
+    download.head()
+    # a previous run wrote the first two blocks
+    (tmp_path / "realtor-data.csv.part").write_bytes(data[:20000].ljust(len(data), b"\0"))
+    (tmp_path / "realtor-data.csv.download.json").write_text(json.dumps({
+        "url": server, "size": len(data), "etag": download.etag,
+        "block_size": 10000, "done": [0, 1],
+    }))
+    download.prepare()
+    download.run()
+    download.finish()
+    assert path.read_bytes() == data
+    assert "bytes=0-9999" not in Handler.requests
+    assert len(Handler.requests) == -(-len(data) // 10000) - 2
+
+def test_download_changed(server, tmp_path):
+    Handler.delay = 0.2
+    download = Download(server, str(tmp_path / "realtor-data.csv"), block_size=10000)
+    download.head()
+    download.prepare()
+    # the file changed since the head, the server sends all of it
+    download.etag = '"changed"'
+    started = time.monotonic()
+    with pytest.raises(DownloadError, match="changed during the download"):
+        download.fetch_block(0)
+    # the body of the 200 is not read
+    assert time.monotonic() - started < 1
+
+def test_download_checksum(server, tmp_path):
+    path = tmp_path / "realtor-data.csv"
+    with pytest.raises(DownloadError):
+        Download(server, str(path), block_size=10000, sha256="0" * 64).download()
+    assert not path.exists()
+    assert not (tmp_path / "realtor-data.csv.download.json").exists()
+
+    Download(server, str(path), block_size=10000, sha256=hashlib.sha256(data).hexdigest()).download()
+    assert path.read_bytes() == data
+
+def test_line_ranges(server, tmp_path):
+    path = tmp_path / "realtor-data.csv"
+    download = Download(server, str(path), connections=4, block_size=10000)
+    download.start()
+    download.wait_for(1000)
+    start = header_end(download.part_path)
+    assert start == len(header)
+    ranges = list(download.line_ranges(start, 5000))
+    download.finish()
+
+    assert ranges == split_ranges(path, start, size=5000)
+    for _, end in ranges:
+        assert data[end - 1:end] == b"\n"
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_download_pipe_import(server, file_app, tmp_path, ranges):
+    Handler.ranges = ranges
+    # the rows are imported while the response arrives
+    Handler.delay = 0.01
+    runner = file_app.test_cli_runner()
+    result = runner.invoke(args=["download-csv", "--url", server, "--pipe-import", "--workers", "1"])
+    assert result.exit_code == 0, result.output
+    assert "Import finished: 2000 added" in result.output
+    assert (tmp_path / "realtor-data.csv").read_bytes() == data
+
+    conn = sqlite3.connect(tmp_path / "database.db")
+    assert conn.execute("SELECT count(*) FROM house").fetchone() == (2000,)
+    assert conn.execute("SELECT offset FROM import_manifest").fetchone() == (len(data),)
+    assert conn.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_house_%'"
+    ).fetchone()[0] > 0
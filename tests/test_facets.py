@@ -0,0 +1,56 @@
+import pytest
+from werkzeug.datastructures import ImmutableMultiDict
+
+from src.conf import db
+from src.house import House
+from src.facets import build_house_facets, facets_from_scan, facets_from_table, update_house_facets
+
+@pytest.fixture
+def houses(app):
+    db.session.add_all([
+        House(id="4" * 64, status="sold", price=2500000.0, bed=7, bath=2, state="Texas", state_code="TX"),
+        House(id="5" * 64, status="for_sale", price=450000.0, bed="", bath=1, state="Texas", state_code="TX"),
+    ])
+    db.session.commit()
+    return db.session.connection().connection.driver_connection
+
+def test_api_get_property_facets(client, houses):
+    build_house_facets(houses)
+    response = client.get("/properties/facets")
+    assert response.status_code == 200
+    assert response.json["total"] == 5
+    facets = response.json["facets"]
+    assert facets["status"] == [{"value": "for_sale", "count": 4}, {"value": "sold", "count": 1}]
+    assert facets["bed"] == [
+        {"value": "1", "count": 1}, {"value": "2", "count": 1}, {"value": "3", "count": 1},
+        {"value": "6+", "count": 1}, {"value": None, "count": 1},
+    ]
+    assert [f["value"] for f in facets["price"]] == [
+        "100000-200000", "200000-300000", "300000-400000", "400000-500000", "2000000+",
+    ]
+
+    response = client.get("/properties/facets", query_string={"status": "for_sale", "state": "Texas"})
+    assert response.json["total"] == 1
+    assert response.json["facets"]["bath"] == [{"value": "1", "count": 1}]
+
+    # range filters are counted with a scan of the houses
+    response = client.get("/properties/facets", query_string={"status": "for_sale", "min_price": 200000})
+    assert response.json["total"] == 3
+    assert response.json["facets"]["bed"] == [
+        {"value": "2", "count": 1}, {"value": "3", "count": 1}, {"value": None, "count": 1},
+    ]
+
+@pytest.mark.parametrize("args", [{}, {"status": "for_sale"}, {"state": "Texas"}, {"status": "sold", "state": "Texas"}])
+def test_facets_table_matches_scan(houses, args):
+    build_house_facets(houses)
+    args = ImmutableMultiDict(args)
+    assert facets_from_table(args) == facets_from_scan(args)
+
+def test_update_house_facets(houses):
+    build_house_facets(houses)
+    db.session.add(House(id="6" * 64, status="sold", price=90000.0, bed=2, state="Texas", state_code="TX"))
+    db.session.commit()
+    update_house_facets(houses, [bytes.fromhex("6" * 64)])
+    args = ImmutableMultiDict()
+    assert facets_from_table(args) == facets_from_scan(args)
+    assert facets_from_table(ImmutableMultiDict({"status": "sold"}))[("price", "0-100000")] == 1
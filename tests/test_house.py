@@ -1,4 +1,6 @@
-from src.house import get_house_by_property
+import sqlite3
+
+from src.house import House, get_house_by_property
 
 class Args:
 
@@ -16,4 +18,33 @@ def test_get_house_by_property(app):
         "status": "for_sale",
     })
     houses = get_house_by_property(args)
-    assert [h.id for h in houses.items] == ["hash1", "hash2", "hash3"]
+    assert [h.id for h in houses.items] == ["1" * 64, "2" * 64, "3" * 64]
+
+def test_command_migrate_house_ids(file_app, tmp_path):
+    runner = file_app.test_cli_runner()
+    conn = sqlite3.connect(tmp_path / "database.db")
+    conn.execute("DROP TABLE house")
+    conn.commit()
+    result = runner.invoke(args=["migrate-house-ids"])
+    assert result.exit_code == 0, result.output
+    assert "There is no house table" in result.output
+
+    # a house table from before the ids were stored as bytes
+    columns = [c.name for c in House.__table__.columns if c.name != "id"]
+    conn.execute(f"CREATE TABLE house (id VARCHAR(64) PRIMARY KEY, {', '.join(columns)})")
+    conn.executemany(
+        "INSERT INTO house (id, status, price) VALUES (?, 'for_sale', ?)",
+        [(f"{i:064x}", i * 1000.0) for i in range(10)],
+    )
+    conn.commit()
+    conn.close()
+    result = runner.invoke(args=["migrate-house-ids"])
+    assert result.exit_code == 0, result.output
+
+    conn = sqlite3.connect(tmp_path / "database.db")
+    sql, = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'house'").fetchone()
+    assert "WITHOUT ROWID" in sql.upper()
+    assert conn.execute("SELECT id, price FROM house ORDER BY id").fetchall() == [
+        (i.to_bytes(32, "big"), i * 1000.0) for i in range(10)
+    ]
+    assert "already migrated" in runner.invoke(args=["migrate-house-ids"]).output
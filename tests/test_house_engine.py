@@ -0,0 +1,108 @@
+import pytest
+from werkzeug.datastructures import ImmutableMultiDict
+from werkzeug.exceptions import NotFound
+
+from src import flask_config
+from src.conf import db
+from src.house import House, get_house_by_property
+from src.house_engine import build_house_columns
+from src.autocomplete import build_house_names
+
+def make_houses():
+    return [
+        House(id="4" * 64, status="for_sale", price=150000.0, bed="", bath=2, zip_code="111", city="Anchorage", state="Alaska", state_code="AK"),
+        House(id="5" * 64, status="for_sale", price=250000.0, bed=4, bath=3, zip_code="444", city="Juneau", state="Alaska", state_code="AK", price_per_sq_ft=100.0),
+        House(id="6" * 64, status="sold", price=250000.0, bed=2, zip_code="444", city="Juneau", state="Alaska", state_code="AK"),
+    ]
+
+queries = [
+    {"status": "for_sale"},
+    {"status": "sold"},
+    {"status": "pending"},
+    {"status": "for_sale", "min_bed": "2"},
+    {"status": "for_sale", "max_bed": "3"},
+    {"status": "for_sale", "min_price": "150000", "max_price": "250000"},
+    {"status": "for_sale", "city": "Juneau"},
+    {"status": "for_sale", "state": "Alaska", "min_bath": "3"},
+    {"status": "for_sale", "zip_code": "111"},
+    {"status": "for_sale", "min_price_per_sqft": "50"},
+    {"status": "for_sale", "per_page": "2", "page": "2", "sort": "price"},
+    {"status": "for_sale", "per_page": "2", "page": "3", "sort": "-price"},
+    {"status": "for_sale", "city_prefix": "jun"},
+]
+
+@pytest.fixture
+def columns_app(app, tmp_path):
+    db.session.add_all(make_houses())
+    db.session.commit()
+    conn = db.session.connection().connection.driver_connection
+    build_house_columns(conn, str(tmp_path / "house_columns"))
+    build_house_names(conn)
+    app.config["HOUSE_COLUMNS_PATH"] = str(tmp_path / "house_columns")
+    yield app
+    app.config["HOUSE_ENGINE"] = "sql"
+    app.config["HOUSE_COLUMNS_PATH"] = flask_config.config["HOUSE_COLUMNS_PATH"]
+
+@pytest.mark.parametrize("query", queries)
+def test_columnar_engine_matches_sql(columns_app, query):
+    args = ImmutableMultiDict(query)
+    columns_app.config["HOUSE_ENGINE"] = "sql"
+    expected = get_house_by_property(args)
+    columns_app.config["HOUSE_ENGINE"] = "columnar"
+    result = get_house_by_property(args)
+    # the SQL engine only has an order with a sort
+    if "sort" in query:
+        assert [h.id for h in result.items] == [h.id for h in expected.items]
+    else:
+        assert sorted(h.id for h in result.items) == sorted(h.id for h in expected.items)
+    assert (result.total, result.pages) == (expected.total, expected.pages)
+
+@pytest.mark.parametrize("engine", ["sql", "columnar"])
+@pytest.mark.parametrize("page", ["0", "4"])
+def test_page_out_of_range(columns_app, engine, page):
+    columns_app.config["HOUSE_ENGINE"] = engine
+    with pytest.raises(NotFound):
+        get_house_by_property(ImmutableMultiDict({"status": "for_sale", "per_page": "2", "page": page}))
+
+def test_columnar_engine_cursor(columns_app):
+    columns_app.config["HOUSE_ENGINE"] = "columnar"
+    args = {"status": "for_sale", "per_page": "3", "cursor": ""}
+    page = get_house_by_property(ImmutableMultiDict(args))
+    assert [h.id for h in page.items] == ["1" * 64, "2" * 64, "3" * 64]
+    page = get_house_by_property(ImmutableMultiDict({**args, "cursor": page.next_cursor}))
+    assert [h.id for h in page.items] == ["4" * 64, "5" * 64]
+    assert page.next_cursor is None
+    assert page.total == 5
+
+def walk_cursor(args):
+    ids, cursor = [], ""
+    while cursor is not None:
+        page = get_house_by_property(ImmutableMultiDict({**args, "per_page": "2", "cursor": cursor}))
+        ids += [h.id[0] for h in page.items]
+        cursor = page.next_cursor
+    return ids
+
+@pytest.mark.parametrize("sort, expected", [
+    ("price", "14253"),
+    ("-price", "35241"),
+    # NULL sorts first and text last like in SQLite
+    ("bath", "12345"),
+    ("-bath", "54321"),
+    ("bed", "12354"),
+    ("-bed", "45321"),
+    ("-price_per_sq_ft", "54321"),
+])
+def test_sort(columns_app, sort, expected):
+    args = {"status": "for_sale", "sort": sort}
+    for engine in ["sql", "columnar"]:
+        columns_app.config["HOUSE_ENGINE"] = engine
+        assert walk_cursor(args) == list(expected)
+        pages = [
+            get_house_by_property(ImmutableMultiDict({**args, "per_page": "2", "page": str(page)}))
+            for page in (1, 2, 3)
+        ]
+        assert [h.id[0] for page in pages for h in page.items] == list(expected)
+
+def test_sort_invalid(columns_app):
+    response, status = get_house_by_property(ImmutableMultiDict({"status": "for_sale", "sort": "street"}))
+    assert status == 400
@@ -0,0 +1,31 @@
+from src.http_cache import bump_generation
+
+def test_cached_response_etag(client, mocker):
+    response = client.get("/demographics/111")
+    assert response.status_code == 200
+    assert response.cache_control.public
+    etag, _ = response.get_etag()
+
+    response = client.get("/demographics/111", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+
+    # the second response comes from memory
+    get_demographic = mocker.patch("src.app.get_demographic")
+    get_demographic.return_value = {"median_income": 222.0}
+    response = client.get("/demographics/111")
+    assert response.json["result"]["median_income"] == 111.0
+    get_demographic.assert_not_called()
+
+    bump_generation()
+    response = client.get("/demographics/111", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    get_demographic.assert_called_once()
+
+def test_cached_response_not_found(client, mocker):
+    goto_and_select = mocker.patch("src.zipwho.goto_and_select")
+    goto_and_select.return_value = "<table></table>"
+    response = client.get("/demographics/333")
+    assert response.status_code == 404
+    assert response.get_etag() == (None, None)
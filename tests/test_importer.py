@@ -0,0 +1,239 @@
+import io
+import os
+import bz2
+import gzip
+import lzma
+import hashlib
+import sqlite3
+
+import pytest
+
+from src.conf import db
+from src.demographic import Demographic
+from src.zip_search_cache import ZipSearch
+from src.importer import (
+    copy_tables,
+    db_optimization,
+    header_end,
+    open_stream,
+    parse_chunks,
+    parse_line,
+    parse_ranges,
+    read_chunks,
+    read_manifest,
+    resume_offset,
+    shadow_db_path,
+    split_ranges,
+    swap_database,
+    write_manifest,
+)
+
+header = "brokered_by,status,price,bed,bath,acre_lot,street,city,state,zip_code,house_size,prev_sold_date\n"
+line = '1.0,for_sale,"1,000.0",3,2,0.5,street,City,Texas,75001,500.0,2020-01-01'
+
+def test_parse_line():
+    columns = parse_line(line + "\n")
+    assert columns[2] == 1000.0
+    assert columns[12:] == ["TX", 2000.0, 2.0, hashlib.sha256(line.encode()).digest()]
+    assert parse_line(line.replace('"1,000.0"', "0")) is None
+    assert parse_line("\n") is None
+
+def test_parse_ranges(tmp_path):
+    path = tmp_path / "realtor-data.csv"
+    lines = [line.replace("street", f"street {i}") for i in range(100)]
+    path.write_text(header + "\n".join(lines) + "\n")
+
+    start = header_end(path)
+    ranges = split_ranges(path, start, size=1000)
+    assert len(ranges) > 1
+    assert ranges[0][0] == start
+    assert ranges[-1][1] == path.stat().st_size
+
+    parsed = [parse_line(l) for l in lines]
+    for workers in [1, 2]:
+        rows = []
+        for chunk, _ in parse_ranges(path, ranges, workers):
+            rows.extend(chunk)
+        assert rows == parsed
+
+@pytest.mark.parametrize("extension, compress", [
+    ("", lambda data: data),
+    (".gz", gzip.compress),
+    (".bz2", bz2.compress),
+    (".xz", lzma.compress),
+])
+def test_parse_chunks(tmp_path, extension, compress):
+    lines = [line.replace("street", f"street {i}") for i in range(100)]
+    data = (header + "\n".join(lines) + "\n").encode()
+    path = tmp_path / f"realtor-data.csv{extension}"
+    path.write_bytes(compress(data))
+
+    with open_stream(str(path)) as file:
+        chunks = list(read_chunks(file, size=1000))
+    assert len(chunks) > 1
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    assert b"".join(chunks) == data[len(header):]
+
+    # the ids are the same as the ones of the uncompressed file
+    parsed = [parse_line(l) for l in lines]
+    for workers in [1, 2]:
+        rows = []
+        for chunk, _ in parse_chunks(chunks, workers):
+            rows.extend(chunk)
+        assert rows == parsed
+
+def test_open_stream_stdin(monkeypatch):
+    data = (header + line + "\n").encode()
+    monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(data)))
+    with open_stream("-") as file:
+        assert list(read_chunks(file)) == [(line + "\n").encode()]
+
+def test_open_stream_zstd(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    data = (header + line + "\n").encode()
+    path = tmp_path / "realtor-data.csv.zst"
+    path.write_bytes(zstandard.ZstdCompressor().compress(data))
+    with open_stream(str(path)) as file:
+        assert file.read() == data
+
+def test_resume_offset(tmp_path):
+    path = tmp_path / "realtor-data.csv"
+    path.write_text(header + line + "\n")
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+
+    assert resume_offset(path, read_manifest(cursor, path)) is None
+    write_manifest(cursor, path, path.stat().st_size)
+    offset = resume_offset(path, read_manifest(cursor, path))
+    assert offset == path.stat().st_size
+
+    # appended lines are imported from the last offset
+    with open(path, "a") as file:
+        file.write(line.replace("street", "new street") + "\n")
+    assert resume_offset(path, read_manifest(cursor, path)) == offset
+
+    # a change before the offset needs a full import
+    path.write_text(header + line.replace("City", "Town") + "\n")
+    assert resume_offset(path, read_manifest(cursor, path)) is None
+
+def test_db_optimization_keeps_wal(tmp_path):
+    conn = sqlite3.connect(tmp_path / "database.db")
+    conn.execute("PRAGMA journal_mode = WAL;")
+    db_optimization(conn.cursor())
+    assert conn.execute("PRAGMA journal_mode;").fetchone() == ("wal",)
+    assert conn.execute("PRAGMA locking_mode;").fetchone() == ("normal",)
+
+    conn = sqlite3.connect(tmp_path / "other.db")
+    db_optimization(conn.cursor())
+    assert conn.execute("PRAGMA journal_mode;").fetchone() == ("off",)
+
+def test_copy_tables(tmp_path):
+    live = sqlite3.connect(tmp_path / "database.db")
+    live.execute("CREATE TABLE demographic (zip_code TEXT PRIMARY KEY, population REAL)")
+    live.execute("INSERT INTO demographic VALUES ('111', 10)")
+    live.commit()
+
+    conn = sqlite3.connect(tmp_path / "shadow.db")
+    conn.execute("CREATE TABLE demographic (zip_code TEXT PRIMARY KEY, population REAL, scraped_at REAL)")
+    copy_tables(conn, str(tmp_path / "database.db"), ["demographic"])
+    assert conn.execute("SELECT * FROM demographic").fetchall() == [("111", 10, None)]
+
+def test_swap_database(tmp_path):
+    path = str(tmp_path / "database.db")
+    sqlite3.connect(path).execute("CREATE TABLE house (id TEXT)")
+    reader = sqlite3.connect(path)
+
+    for version in range(2):
+        new_path = shadow_db_path(path)
+        conn = sqlite3.connect(new_path)
+        conn.execute("CREATE TABLE house (id TEXT)")
+        conn.execute("INSERT INTO house VALUES (?)", (str(version),))
+        conn.commit()
+        swap_database(path, new_path)
+        assert os.readlink(path) == os.path.basename(new_path)
+        assert sqlite3.connect(path).execute("SELECT id FROM house").fetchall() == [(str(version),)]
+
+    # only the live version is left, the reader of the first file still reads it
+    assert set(os.listdir(tmp_path)) == {"database.db", os.path.basename(new_path)}
+    assert reader.execute("SELECT count(*) FROM house").fetchone() == (0,)
+
+def write_csv(path, city, count, mode="w"):
+    lines = [line.replace("City", city).replace("street", f"street {i}") for i in range(count)]
+    with open(path, mode) as file:
+        if mode == "w":
+            file.write(header)
+        file.write("\n".join(lines) + "\n")
+
+def test_command_import_csv_shadow(file_app, tmp_path):
+    runner = file_app.test_cli_runner()
+    client = file_app.test_client()
+    write_csv(tmp_path / "realtor-data.csv", "Dallas", 3)
+    result = runner.invoke(args=["import-csv", "--workers", "1"])
+    assert result.exit_code == 0, result.output
+    db.session.add(Demographic(zip_code="75001", median_income=1.0))
+    db.session.add(ZipSearch(key="TX", zips="[]", created_at=1.0))
+    db.session.commit()
+    db.session.remove()
+    params = {"status": "for_sale", "per_page": 10}
+    assert client.get("/properties", query_string=params).json["total"] == 3
+
+    write_csv(tmp_path / "realtor-data.csv", "Austin", 5)
+    result = runner.invoke(args=["import-csv", "--workers", "1", "--shadow"])
+    assert result.exit_code == 0, result.output
+    live_path = os.path.realpath(tmp_path / "database.db")
+    assert os.path.islink(tmp_path / "database.db")
+    assert set(os.listdir(tmp_path)) == {"database.db", os.path.basename(live_path), "realtor-data.csv"}
+
+    # the running app reads the new database, the session of the last
+    # request is removed like at the end of a request outside tests
+    db.session.remove()
+    response = client.get("/properties", query_string=params)
+    assert response.json["total"] == 5
+    assert {h["city"] for h in response.json["results"]} == {"Austin"}
+    assert client.get("/demographics/75001").json["result"]["median_income"] == 1.0
+    response = client.get("/properties/stats", query_string={"status": "for_sale", "group_by": "city"})
+    assert [(r["city"], r["count"]) for r in response.json["results"]] == [("Austin", 5)]
+    conn = sqlite3.connect(live_path)
+    assert conn.execute("SELECT key FROM zip_search_cache").fetchall() == [("TX",)]
+    # the next import resumes from the manifest of the shadow one
+    assert conn.execute("SELECT offset FROM import_manifest").fetchall() == [
+        (os.path.getsize(tmp_path / "realtor-data.csv"),)
+    ]
+
+def test_command_import_csv_workers(file_app, tmp_path):
+    write_csv(tmp_path / "realtor-data.csv", "Dallas", 200)
+    result = file_app.test_cli_runner().invoke(args=["import-csv", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Import finished: 200 added" in result.output
+
+    lines = (tmp_path / "realtor-data.csv").read_text().splitlines()[1:]
+    conn = sqlite3.connect(tmp_path / "database.db")
+    assert sorted(row[0] for row in conn.execute("SELECT id FROM house")) == sorted(
+        parse_line(l)[-1] for l in lines
+    )
+    assert conn.execute("SELECT count(*) FROM market_stats WHERE key = 'Dallas'").fetchone() == (1,)
+
+def test_command_import_csv_appended_lines(file_app, tmp_path):
+    runner = file_app.test_cli_runner()
+    write_csv(tmp_path / "realtor-data.csv", "Dallas", 100)
+    result = runner.invoke(args=["import-csv", "--workers", "2"])
+    assert "Import finished: 100 added" in result.output
+
+    write_csv(tmp_path / "realtor-data.csv", "Austin", 20, mode="a")
+    result = runner.invoke(args=["import-csv", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+    assert "resuming at byte" in result.output
+    assert "Import finished: 20 added" in result.output
+
+    conn = sqlite3.connect(tmp_path / "database.db")
+    assert conn.execute("SELECT city, count(*) FROM house GROUP BY city ORDER BY city").fetchall() == [
+        ("Austin", 20), ("Dallas", 100),
+    ]
+    assert conn.execute("SELECT offset FROM import_manifest").fetchone() == (
+        (tmp_path / "realtor-data.csv").stat().st_size,
+    )
+    assert conn.execute("SELECT count FROM market_stats WHERE key = 'Austin'").fetchone() == (20,)
+
+    # nothing is added when the file didn't change
+    result = runner.invoke(args=["import-csv", "--workers", "2"])
+    assert "Import finished: 0 added" in result.output
@@ -0,0 +1,62 @@
+import logging
+
+from src import browser
+from src.browser import PagePool, ThreadedPagePool
+from src.metrics import Histogram, record_scrape
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "latency", [0.1, 1], ("endpoint",))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+    assert histogram.render() == [
+        "# HELP latency_seconds latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{endpoint="/a",le="0.1"} 1',
+        'latency_seconds_bucket{endpoint="/a",le="1"} 2',
+        'latency_seconds_bucket{endpoint="/a",le="+Inf"} 3',
+        'latency_seconds_sum{endpoint="/a"} 5.55',
+        'latency_seconds_count{endpoint="/a"} 3',
+    ]
+
+def test_request_metrics(client, mocker):
+    goto_and_select = mocker.patch("src.zipwho.goto_and_select")
+    goto_and_select.side_effect = lambda *args, **kwargs: record_scrape(0.25) or "<table></table>"
+
+    response = client.get("/properties?status=for_sale&per_page=1")
+    assert response.status_code == 200
+    timing = dict(part.split(";dur=") for part in response.headers["Server-Timing"].split(", "))
+    assert float(timing["sql"]) > 0
+    assert float(timing["scrape"]) == 0
+
+    response = client.get("/demographics/333")
+    assert 'scrape;dur=250.00;desc="browser"' in response.headers["Server-Timing"]
+
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{endpoint="/properties",method="GET",status="200"}' in metrics
+    assert 'http_request_duration_seconds_count{endpoint="/demographics/<string:zip_code>",method="GET",status="404"}' in metrics
+    assert 'scrape_duration_seconds_count{path="browser",result="ok"}' in metrics
+    assert 'cache_hit_ratio{cache="demographic"}' in metrics
+
+def test_slow_query_log(app, client, monkeypatch, caplog):
+    monkeypatch.setitem(app.config, "SLOW_QUERY_SECONDS", 0)
+    with caplog.at_level(logging.WARNING):
+        client.get("/properties?status=for_sale&per_page=1")
+    assert "slow query" in caplog.text
+    assert "  SEARCH house USING" in caplog.text
+
+def test_page_pool_metrics(client, monkeypatch):
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert "browser_pool_pages" not in metrics
+
+    pool = PagePool(size=3)
+    pool.in_use = 2
+    pool.waiting = 1
+    monkeypatch.setattr(browser, "page_pool", ThreadedPagePool(pool))
+    try:
+        metrics = client.get("/metrics").get_data(as_text=True)
+    finally:
+        browser.page_pool.close()
+    assert "browser_pool_pages 3\n" in metrics
+    assert "browser_pool_pages_in_use 2\n" in metrics
+    assert "browser_pool_waiting 1\n" in metrics
@@ -0,0 +1,100 @@
+import time
+import asyncio
+
+from src.conf import db
+from src.house import House
+from src.demographic import Demographic
+from src.scraper import (
+    Checkpoint,
+    pending_zip_codes,
+    refresh_demographics,
+    scrape_zip_codes,
+    stale_zip_codes,
+)
+
+# 17 rows of 3 cells, the second cell of the first row is 2
+table_content = "<table>%s</table>" % "".join(
+    "<tr><td>%s</td><td>%s</td><td>%s</td></tr>" % (3*i+1, 3*i+2, 3*i+3)
+    for i in range(17)
+)
+
+class FakePool:
+
+    async def goto_and_select(self, full_url, selector):
+        if "444" in full_url:
+            raise TimeoutError("timeout")
+        if "555" in full_url:
+            return table_content
+        return "<table><tr><td>no data</td></tr></table>"
+
+def test_scrape_zip_codes(app, tmp_path):
+    for zip_code in ["444", "555", "666"]:
+        db.session.add(House(id=zip_code * 8, status="sold", zip_code=zip_code))
+    db.session.commit()
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    # 111 and 222 are already scraped
+    zip_codes = pending_zip_codes(checkpoint, max_attempts=1)
+    assert zip_codes == ["333", "444", "555", "666"]
+
+    report = asyncio.run(scrape_zip_codes(
+        FakePool(), zip_codes, checkpoint, concurrency=2, batch_size=2,
+    ))
+    assert (report.scraped, report.empty, report.failed) == (1, 2, 1)
+    assert db.session.get(Demographic, "555").median_income == 2.0
+    assert db.session.get(Demographic, "666").median_income is None
+
+    # a new run resumes with the zip codes that failed
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    assert pending_zip_codes(checkpoint, max_attempts=2) == ["444"]
+    assert pending_zip_codes(checkpoint, max_attempts=1) == []
+
+def test_refresh_demographics(app, tmp_path):
+    now = time.time()
+    houses = {"444": 2, "555": 3, "666": 2, "777": 4}
+    for zip_code, count in houses.items():
+        for i in range(count):
+            db.session.add(House(id=f"{zip_code}{i}" * 8, status="sold", zip_code=zip_code))
+    db.session.add_all([
+        # stale, negative and expired, negative but recent, fresh
+        Demographic(zip_code="444", median_income=1.0, scraped_at=now - 100),
+        Demographic(zip_code="555", scraped_at=now - 20),
+        Demographic(zip_code="666", scraped_at=now - 5),
+        Demographic(zip_code="777", median_income=7.0, scraped_at=now - 5),
+    ])
+    db.session.commit()
+
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    # 111 and 222 were scraped before scraped_at, 555 has more houses than 444
+    zip_codes = stale_zip_codes(checkpoint, 1, ttl=50, negative_ttl=10, now=now)
+    assert zip_codes == ["555", "444", "111", "222"]
+    assert stale_zip_codes(checkpoint, 1, ttl=50, negative_ttl=10, limit=2, now=now) == ["555", "444"]
+
+    # 555 has data now, 666 still has none
+    report = asyncio.run(scrape_zip_codes(
+        FakePool(), ["555", "666"], checkpoint, write=refresh_demographics,
+    ))
+    assert (report.scraped, report.empty) == (1, 1)
+    assert db.session.get(Demographic, "555").median_income == 2.0
+    assert db.session.get(Demographic, "666").scraped_at > now
+
+    db.session.expire_all()
+    asyncio.run(scrape_zip_codes(FakePool(), ["444"], checkpoint, write=refresh_demographics))
+    demographic = db.session.get(Demographic, "444")
+    assert (demographic.median_income, demographic.scraped_at) == (1.0, now - 100)
+    # 444 failed once, it's tried again after negative_ttl
+    assert "444" not in stale_zip_codes(checkpoint, 1, ttl=50, negative_ttl=10)
+    assert "444" in stale_zip_codes(checkpoint, 1, ttl=50, negative_ttl=10, now=time.time() + 10)
+
+    # 777 had data and zipwho.com returns none, it keeps its values
+    asyncio.run(scrape_zip_codes(FakePool(), ["777"], checkpoint, write=refresh_demographics))
+    db.session.expire_all()
+    demographic = db.session.get(Demographic, "777")
+    assert demographic.median_income == 7.0
+    assert demographic.scraped_at > now
+
+    # nothing is started after the deadline
+    report = asyncio.run(scrape_zip_codes(
+        FakePool(), ["777"], checkpoint, write=refresh_demographics, deadline=time.monotonic(),
+    ))
+    assert report.done() == 0
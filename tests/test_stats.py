@@ -0,0 +1,44 @@
+import random
+
+from src.conf import db
+from src.stats import QuantileSketch, build_market_stats, update_market_stats
+
+def test_quantile_sketch():
+    random.seed(0)
+    values = sorted(random.uniform(1000, 1000000) for _ in range(10001))
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    for q in [0.1, 0.5, 0.9]:
+        expected = values[int(q * 10000)]
+        assert abs(sketch.quantile(q) - expected) <= 0.01 * expected
+
+    merged = QuantileSketch.loads(sketch.dumps())
+    merged.merge(sketch)
+    assert merged.count() == 2 * sketch.count()
+
+def test_api_get_market_stats(client):
+    conn = db.session.connection().connection.driver_connection
+    build_market_stats(conn)
+    response = client.get("/properties/stats", query_string={"status": "for_sale"})
+    assert response.status_code == 200
+    result, = response.json["results"]
+    assert result["count"] == 3
+    assert abs(result["median_price"] - 200000) <= 2000
+
+    update_market_stats(conn, [("for_sale", "City", "444", "", 1000000.0, 0.0)])
+    params = {"status": "for_sale", "group_by": "zip_code"}
+    response = client.get("/properties/stats", query_string=params)
+    assert [r["zip_code"] for r in response.json["results"]] == ["111", "222", "333", "444"]
+    response = client.get("/properties/stats", query_string={"status": "for_sale"})
+    assert response.json["results"][0]["count"] == 4
+
+    # the house without house_size only counts in the price percentiles
+    result = client.get("/properties/stats", query_string={"status": "for_sale", "zip_code": "444", "group_by": "zip_code"}).json["results"][0]
+    assert result["price_percentiles"]["p50"] is not None
+    assert result["price_per_sq_ft_percentiles"]["p10"] is None
+
+    response = client.get("/properties/stats", query_string={"status": "for_sale", "limit": "0"})
+    assert len(response.json["results"]) == 1
+
+    assert client.get("/properties/stats", query_string={"group_by": "x"}).status_code == 400
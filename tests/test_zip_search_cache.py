@@ -0,0 +1,40 @@
+from src.zipwho import demographic_ranges
+from src.zip_search_cache import (
+    ZipSearch,
+    cached_zip_search,
+    get_zip_search_cache_stats,
+    zip_search_key,
+)
+
+def test_zip_search_key():
+    args_1 = {"state_code": "AK", "min_median_income": "10000", "page": "2", "min_price": "1"}
+    args_2 = {"max_median_age": "", "min_median_income": "10000.0", "state_code": "AK"}
+    key = zip_search_key("AK", demographic_ranges(args_1))
+    assert key == "AK:MedianIncome-10000-"
+    assert key == zip_search_key("AK", demographic_ranges(args_2))
+
+def test_cached_zip_search(app, monkeypatch):
+    searches = []
+
+    def search(state_code, ranges):
+        searches.append((state_code, ranges))
+        return ["111"]
+
+    hits = get_zip_search_cache_stats()["hits"]
+    ranges = demographic_ranges({"min_median_income": "10000"})
+    assert cached_zip_search("AK", ranges, search) == ["111"]
+    assert cached_zip_search("AK", ranges, search) == ["111"]
+    assert len(searches) == 1
+    assert get_zip_search_cache_stats()["hits"] == hits + 1
+
+    # expired entries are searched again
+    monkeypatch.setitem(app.config, "ZIP_SEARCH_CACHE_TTL", 0)
+    cached_zip_search("AK", ranges, search)
+    assert len(searches) == 2
+    monkeypatch.setitem(app.config, "ZIP_SEARCH_CACHE_TTL", 3600)
+
+    # the oldest entries are evicted
+    monkeypatch.setitem(app.config, "ZIP_SEARCH_CACHE_SIZE", 2)
+    for state_code in ["AL", "AZ"]:
+        cached_zip_search(state_code, ranges, search)
+    assert sorted(e.key.split(":")[0] for e in ZipSearch.query) == ["AL", "AZ"]
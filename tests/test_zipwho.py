@@ -1,15 +1,15 @@
-from src.zipwho import build_filters_argument, table_values
+from src.zipwho import demographic_ranges, ranges_to_filters, table_values
 
-def test_build_filters_argument():
+def test_ranges_to_filters():
     args = {
         "min_median_income": 1000,
-        "max_median_income": 2000,
-        "min_cost_of_living_index": 1,
+        "max_median_income": "2000.0",
+        "min_cost_of_living_index": 1.5,
         "max_cost_of_living_index": 2,
         "others": 1,
     }
-    filter = build_filters_argument(args)
-    assert "MedianIncome-1000-2000_CostOfLivingIndex-1-2" == filter
+    filter = ranges_to_filters(demographic_ranges(args))
+    assert "MedianIncome-1000-2000_CostOfLivingIndex-1.5-2" == filter
 
 def test_table_values():
     values = [